@@ -5,3 +5,6 @@ class ChunkConfig(YamlModel):
     chunk_token_size: int = 1200
     chunk_overlap_token_size: int = 100
     chunk_method: str = "chunking_by_token_size"
+    chunk_batch_size: int = 1024  # Number of documents tokenized and chunked at once
+    skip_unchanged_chunks: bool = True  # Skip chunking when the corpus and the chunk parameters are unchanged
+    chunk_max_workers: int = 4  # Number of the worker processes chunking the document shards of a batch
@@ -7,8 +7,13 @@ class GraphConfig(YamlModel):
     graph_type: str = "er_graph"
     # Building graph
     extract_two_step: bool = True
+    extract_fused: bool = False  # Extract the entities and the triples of the two-step extraction in one call
     max_gleaning: int = 1
     force: bool = False
+    max_inflight_chunks: int = 64  # Number of chunks being extracted concurrently
+    merge_batch_size: int = 256  # Number of extracted chunks merged into the graph at once
+    chunk_pack_max_tokens: int = 0  # Pack small chunks into one extraction call up to this token budget, 0 disables it
+    build_shards: int = 0  # Number of worker processes of the sharded map-reduce build, 0 or 1 builds in process
 
     # For ER graph & KG graph and & RKG graph
     enable_entity_description: bool = False
@@ -16,6 +21,15 @@ class GraphConfig(YamlModel):
     enable_edge_description: bool = False
     enable_edge_name: bool = False
     prior_prob: float = 0.8
+    # For passage graph entity linking
+    entity_linker: str = "wat"  # wat/dictionary
+    entity_linker_alias_path: Optional[str] = None  # JSON alias table {title: [aliases]} of the dictionary linker
+    entity_linker_max_concurrency: int = 32  # Max number of concurrent linking requests
+    entity_linker_max_retries: int = 3
+    entity_linker_timeout: float = 60  # Timeout (s) of one linking request
+    enable_entity_linker_cache: bool = True  # Cache the annotations on disk by the hash of the text
+    passage_graph_bipartite: bool = False  # Store the passage-title mentions instead of the passage-passage edges
+    max_title_frequency: int = 0  # Drop the titles mentioned by more passages than this, 0 keeps all of them
     enable_edge_keywords: bool = False
     # Graph clustering
     use_community: bool = False  # Default to False
@@ -23,10 +37,22 @@ class GraphConfig(YamlModel):
     max_graph_cluster_size: int = 10
     graph_cluster_seed: int = 0xDEADBEEF
     summary_max_tokens: int = 500
+    summary_batch_size: int = 8  # Max number of descriptions packed into one summarization call
+    summary_batch_max_tokens: int = 8000  # Token budget of the descriptions packed into one summarization call
+    enable_summary_cache: bool = True  # Cache the summaries by the hash of the merged descriptions
     llm_model_max_token_size: int = 32768
+    # Entity canonicalization
+    enable_entity_canonicalization: bool = False  # Merge the surface variants of an entity name into one node
+    canonicalization_jaccard_threshold: float = 0.8  # Min Jaccard similarity of the name shingles to merge two names
+    canonicalization_use_embedding: bool = True  # Also block and compare the names by their embeddings
+    canonicalization_embedding_threshold: float = 0.92  # Min cosine similarity of the name embeddings to merge two names
+    canonicalization_top_k: int = 5  # Number of the nearest names compared by embedding
+    canonicalization_seed: int = 0xDEADBEEF
 
     # For Tree graph config 
     build_tree_from_leaves: bool = False
+    tree_incremental: bool = False  # Insert the new chunks into the persisted tree instead of rebuilding it
+    tree_drift_threshold: float = 1.5  # Rebuild the upper layers when the new leaves are this much farther from their clusters than the existing leaves
     reduction_dimension: int = 5
     summarization_length: int = 100
     num_layers: int = 10
@@ -45,8 +71,16 @@ class GraphConfig(YamlModel):
     tol: float = 1e-4
     max_iter: int = 300
     size_of_clusters: int = 10
+    balanced_candidate_centers: int = 8  # Nearest centers a point may be assigned to by balanced K-means before the fallback
+    summary_max_concurrency: int = 16  # Number of cluster summaries requested concurrently while building a layer
+    embedding_max_concurrency: int = 4  # Number of embedding batches sent concurrently while embedding a layer
+    cluster_max_workers: int = 4  # Number of processes fitting the GMM candidates, 1 fits them in-process
+    cluster_search: str = "sweep"  # "sweep" fits every candidate cluster count, "early_stop" hill-climbs over them
+    cluster_search_patience: int = 3  # Candidates fitted on each side of the best BIC before the search stops
+    umap_cache_size: int = 128  # Number of UMAP reductions cached by embedding set
 
     # For graph augmentation
     similarity_threshold: float = 0.8
     similarity_top_k: int = 10
     similarity_max: float = 1.0
+    similarity_block_size: int = 1024  # Number of entities compared against the embedding matrix at once
@@ -43,6 +43,7 @@ class QueryConfig(YamlModel):
 
     # For RAPTOR
     tree_search: bool = False
+    tree_traversal: bool = False  # Beam search from the root layer down instead of the collapsed-tree search
 
     # For TOG
     depth: int = 3
@@ -15,4 +15,7 @@ class RetrieverConfig(YamlModel):
     damping: float = 0.1
     max_token_for_local_context: int = 4800  # 12000 * 0.4
     use_relations_vdb: bool = False
-    use_subgraphs_vdb: bool = False
\ No newline at end of file
+    use_subgraphs_vdb: bool = False
+    # For the RAPTOR tree traversal
+    tree_beam_width: int = 5  # Nodes of a layer whose children are expanded into the next layer
+    tree_layer_top_k: int = 5  # Nodes returned from every layer
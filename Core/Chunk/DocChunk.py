@@ -1,10 +1,39 @@
 import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from Core.Chunk.ChunkFactory import create_chunk_method
-from Core.Common.Utils import mdhash_id
+from Core.Common.Constants import GRAPH_FIELD_SEP
+from Core.Common.Utils import mdhash_id, split_string_by_multi_markers
 from Core.Common.Logger import logger
 from Core.Schema.ChunkSchema import TextChunk
 from Core.Storage.ChunkKVStorage import ChunkKVStorage
-from typing import List, Union
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, Union
+
+
+CHUNK_SHARDS_PER_WORKER = 4  # Number of the document shards of a batch per worker process
+
+
+async def _chunk_docs(chunk_method, token_model, docs: List[Tuple[str, str, str]], overlap_token_size: int,
+                      max_token_size: int) -> List[dict]:
+    tokens = token_model.encode_batch([content for _, content, _ in docs], num_threads=16)
+    return await chunk_method(
+        tokens,
+        doc_keys=[doc_key for doc_key, _, _ in docs],
+        tiktoken_model=token_model,
+        title_list=[title for _, _, title in docs],
+        overlap_token_size=overlap_token_size,
+        max_token_size=max_token_size,
+    )
+
+
+def _chunk_shard(chunk_method_name: str, token_model, docs: List[Tuple[str, str, str]], overlap_token_size: int,
+                 max_token_size: int) -> List[dict]:
+    # Module level, so that it can be sent to the worker processes; the chunking methods are registered by name
+    return asyncio.run(_chunk_docs(create_chunk_method(chunk_method_name), token_model, docs, overlap_token_size,
+                                   max_token_size))
 
 
 class DocChunk:
@@ -13,6 +42,7 @@ class DocChunk:
         self.chunk_method = create_chunk_method(self.config.chunk_method)
         self._chunk = ChunkKVStorage(namespace=namesapce)
         self.token_model = token_model
+        self._pool = None
 
     @property
     def namespace(self):
@@ -23,56 +53,126 @@ class DocChunk:
     def namespace(self, namespace):
         self.namespace = namespace
 
-    async def build_chunks(self, docs: Union[str, List[str]], force=True):
+    async def build_chunks(self, docs: Union[str, List[str], List[dict], Iterable], force=True):
+        """
+        Chunk the documents in batches of `chunk_batch_size` documents, so that only the tokens of one batch are
+        held in memory at a time. The documents may be any (lazy) iterable of strings or dicts.
+
+        The chunks are keyed by the hash of their content, so a passage shared by several documents is stored once
+        and references all of them. Even when forced, the stage is skipped if the stored chunks were built from the
+        same corpus with the same chunk parameters, which is only checked for inputs that can be iterated twice.
+        """
         logger.info("Starting chunk the given documents")
-  
-        is_exist = await self._load_chunk(force)
-        if not is_exist or force:
-
-            # TODO: Now we only support the str, list[str], Maybe for more types.
-            if isinstance(docs, str):
-                docs = [docs]
-
-            if isinstance(docs, list):
-                if all(isinstance(doc, dict) for doc in docs):
-                    docs = {
-                        mdhash_id(doc["content"].strip(), prefix="doc-"): {
-                            "content": doc["content"].strip(),
-                            "title": doc.get("title", ""),
-                        }
-                        for doc in docs
-                    }
-                else:
-                    docs = {
-                        mdhash_id(doc.strip(), prefix="doc-"): {
-                            "content": doc.strip(),
-                            "title": "",
-                        }
-                        for doc in docs
-                    }
-
-            flatten_list = list(docs.items())
-            docs = [doc[1]["content"] for doc in flatten_list]
-            doc_keys = [doc[0] for doc in flatten_list]
-            title_list = [doc[1]["title"] for doc in flatten_list]
-            tokens = self.token_model.encode_batch(docs, num_threads=16)
-
-            chunks = await self.chunk_method(
-                tokens,
-                doc_keys=doc_keys,
-                tiktoken_model=self.token_model,
-                title_list=title_list,
-                overlap_token_size=self.config.chunk_overlap_token_size,
-                max_token_size=self.config.chunk_token_size,
-            )
-
-            for chunk in chunks:
-                chunk["chunk_id"] = mdhash_id(chunk["content"], prefix="chunk-")
-                await self._chunk.upsert(chunk["chunk_id"], TextChunk(**chunk))
+
+        fingerprint = None
+        if self.config.skip_unchanged_chunks and iter(docs) is not docs:
+            hasher = self._new_hasher()
+            for _ in self._hash_docs(self._iter_docs(docs), hasher):
+                pass
+            fingerprint = hasher.hexdigest()
+
+        is_exist = await self._load_chunk(force and fingerprint is None)
+        if is_exist and force and self._chunk.fingerprint != fingerprint:
+            is_exist = False
+        if is_exist:
+            logger.info("Chunks of the same corpus and chunk parameters exist, skip chunking")
+        else:
+            self._chunk.clear()
+            hasher = self._new_hasher()
+            next_index = 0
+            docs = self._hash_docs(self._iter_docs(docs), hasher)
+            try:
+                while batch := list(islice(docs, self.config.chunk_batch_size)):
+                    next_index = await self._chunk_batch(batch, next_index)
+            finally:
+                self.close()
+            self._chunk.fingerprint = hasher.hexdigest()
+            logger.info(f"Chunked the documents into {next_index} distinct chunks")
 
             await self._chunk.persist()
         logger.info("✅ Finished the chunking stage")
 
+    def _new_hasher(self):
+        hasher = hashlib.md5()
+        params = (self.config.chunk_method, self.config.chunk_token_size, self.config.chunk_overlap_token_size,
+                  getattr(self.token_model, "name", None))
+        hasher.update(repr(params).encode())
+        return hasher
+
+    @staticmethod
+    def _hash_docs(docs: Iterator[Tuple[str, str, str]], hasher) -> Iterator[Tuple[str, str, str]]:
+        for doc in docs:
+            hasher.update(repr(doc).encode())
+            yield doc
+
+    @staticmethod
+    def _iter_docs(docs) -> Iterator[Tuple[str, str, str]]:
+        # Yield the (doc_key, content, title) of the distinct documents
+        # TODO: Now we only support the str, list[str], Maybe for more types.
+        if isinstance(docs, str):
+            docs = [docs]
+        if isinstance(docs, dict):
+            # Documents already keyed by their ids
+            docs = ((key, doc["content"].strip(), doc.get("title", "")) for key, doc in docs.items())
+        else:
+            docs = ((None, doc["content"].strip(), doc.get("title", "")) if isinstance(doc, dict) else
+                    (None, doc.strip(), "") for doc in docs)
+
+        seen_keys = set()
+        for doc_key, content, title in docs:
+            doc_key = doc_key or mdhash_id(content, prefix="doc-")
+            if doc_key in seen_keys:
+                continue
+            seen_keys.add(doc_key)
+            yield doc_key, content, title
+
+    async def _chunk_batch(self, batch: List[Tuple[str, str, str]], next_index: int) -> int:
+        if self._num_workers <= 1 or len(batch) == 1:
+            chunks = await _chunk_docs(self.chunk_method, self.token_model, batch,
+                                       self.config.chunk_overlap_token_size, self.config.chunk_token_size)
+        else:
+            # More shards than workers balance the uneven documents, the chunks are gathered in the shard order
+            shard_size = -(-len(batch) // (self._num_workers * CHUNK_SHARDS_PER_WORKER))
+            loop = asyncio.get_running_loop()
+            shard_chunks = await asyncio.gather(
+                *[loop.run_in_executor(self._get_pool(), _chunk_shard, self.config.chunk_method, self.token_model,
+                                       batch[start: start + shard_size], self.config.chunk_overlap_token_size,
+                                       self.config.chunk_token_size)
+                  for start in range(0, len(batch), shard_size)])
+            chunks = [chunk for shard in shard_chunks for chunk in shard]
+
+        for chunk in chunks:
+            chunk["chunk_id"] = mdhash_id(chunk["content"], prefix="chunk-")
+            existing = await self._chunk.get_by_key(chunk["chunk_id"])
+            if existing is not None:
+                # A duplicate passage only adds its document to the references of the stored chunk
+                doc_ids = split_string_by_multi_markers(str(existing.doc_id), [GRAPH_FIELD_SEP])
+                if str(chunk["doc_id"]) not in doc_ids:
+                    existing.doc_id = GRAPH_FIELD_SEP.join(doc_ids + [str(chunk["doc_id"])])
+                    await self._chunk.upsert(existing.chunk_id, existing)
+                continue
+            # The chunk indices run over the distinct chunks of the whole corpus, not over the batch
+            chunk["index"] = next_index
+            next_index += 1
+            await self._chunk.upsert(chunk["chunk_id"], TextChunk(**chunk))
+        return next_index
+
+    @property
+    def _num_workers(self) -> int:
+        # No more worker processes than the available cores
+        return min(self.config.chunk_max_workers, os.cpu_count() or 1)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self._num_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
     async def _load_chunk(self, force=False):
         if force:
             return False
@@ -92,9 +192,8 @@ class DocChunk:
         return await self._chunk.get_index_by_key(key)
 
     async def get_data_by_key(self, chunk_id):
-
         chunk = await self._chunk.get_by_key(chunk_id)
-        return chunk.content
+        return None if chunk is None else chunk.content
 
     async def get_data_by_index(self, index):
         chunk = await self._chunk.get_data_by_index(index)
@@ -1,4 +1,7 @@
-from typing import List, Optional, Union, Literal
+from typing import List, Optional, Tuple, Union, Literal
+
+import numpy as np
+
 from Core.Chunk.ChunkFactory import register_chunking_method
 from Core.Common.Constants import Default_text_separator
 
@@ -19,52 +22,79 @@ class SeparatorSplitter:
         self._length_function = length_function
 
     def split_tokens(self, tokens: List[int]) -> List[List[int]]:
-        splits = self._split_tokens_with_separators(tokens)
-        return self._merge_splits(splits)
-
-    def _split_tokens_with_separators(self, tokens: List[int]) -> List[List[int]]:
-        splits = []
-        current_split = []
-        i = 0
-        while i < len(tokens):
-            separator_found = False
-            for separator in self._separators:
-                if tokens[i:i + len(separator)] == separator:
-                    if self._keep_separator in [True, "end"]:
-                        current_split.extend(separator)
-                    if current_split:
-                        splits.append(current_split)
-                        current_split = []
-                    if self._keep_separator == "start":
-                        current_split.extend(separator)
-                    i += len(separator)
-                    separator_found = True
-                    break
-            if not separator_found:
-                current_split.append(tokens[i])
-                i += 1
-        if current_split:
-            splits.append(current_split)
-        return [s for s in splits if s]
-
-    def _merge_splits(self, splits: List[List[int]]) -> List[List[int]]:
-        if not splits:
+        """
+        Split the tokens at the separators, then merge the splits into chunks of at most `chunk_size` tokens.
+
+        The split points are found with vectorized comparisons over the token array, and the splits are merged
+        by their lengths only, the chunks are sliced from the token array at the end. The length function is
+        assumed to be additive over the concatenated splits.
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        spans = self._split_tokens_with_separators(tokens)
+        return [chunk.tolist() for chunk in self._merge_splits(tokens, spans)]
+
+    def _find_separators(self, tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the start positions and the lengths of the separators consumed by a left-to-right scan, where the
+        first listed separator matching at a position wins and the scan resumes after it.
+        """
+        n = len(tokens)
+        match_length = np.zeros(n, dtype=np.int64)
+        # Earlier separators take precedence, so they are written last
+        for separator in reversed(self._separators):
+            length = len(separator)
+            if length == 0 or length > n:
+                continue
+            matched = tokens[:n - length + 1] == separator[0]
+            for offset in range(1, length):
+                matched &= tokens[offset:n - length + 1 + offset] == separator[offset]
+            match_length[:n - length + 1][matched] = length
+
+        starts = np.flatnonzero(match_length)
+        lengths = match_length[starts]
+        if len(starts) == 0 or lengths.max() == 1:
+            return starts, lengths
+        # A multi-token separator hides the matches starting inside it
+        accepted = np.zeros(len(starts), dtype=bool)
+        next_free = 0
+        for i, (start, length) in enumerate(zip(starts.tolist(), lengths.tolist())):
+            if start >= next_free:
+                accepted[i] = True
+                next_free = start + length
+        return starts[accepted], lengths[accepted]
+
+    def _split_tokens_with_separators(self, tokens: np.ndarray) -> List[Tuple[int, int]]:
+        # The splits are (start, end) spans of the token array
+        starts, lengths = self._find_separators(tokens)
+        if self._keep_separator in [True, "end"]:
+            bounds = np.concatenate([[0], starts + lengths, [len(tokens)]])
+            split_starts, split_ends = bounds[:-1], bounds[1:]
+        elif self._keep_separator == "start":
+            bounds = np.concatenate([[0], starts, [len(tokens)]])
+            split_starts, split_ends = bounds[:-1], bounds[1:]
+        else:
+            split_starts = np.concatenate([[0], starts + lengths])
+            split_ends = np.concatenate([starts, [len(tokens)]])
+        non_empty = split_ends > split_starts
+        return list(zip(split_starts[non_empty].tolist(), split_ends[non_empty].tolist()))
+
+    def _merge_splits(self, tokens: np.ndarray, spans: List[Tuple[int, int]]) -> List[np.ndarray]:
+        if not spans:
             return []
 
-        merged_splits = []
-        current_chunk = []
-
-        for split in splits:
-            if not current_chunk:
-                current_chunk = split
-            elif self._length_function(current_chunk) + self._length_function(split) <= self._chunk_size:
-                current_chunk.extend(split)
+        # Greedily group the consecutive splits by their lengths
+        lengths = [self._length_function(tokens[start:end]) for start, end in spans]
+        groups = []
+        group_start, group_length = 0, lengths[0]
+        for i in range(1, len(spans)):
+            if group_length + lengths[i] <= self._chunk_size:
+                group_length += lengths[i]
             else:
-                merged_splits.append(current_chunk)
-                current_chunk = split
+                groups.append((group_start, i))
+                group_start, group_length = i, lengths[i]
+        groups.append((group_start, len(spans)))
 
-        if current_chunk:
-            merged_splits.append(current_chunk)
+        merged_splits = [self._join_spans(tokens, spans[first:last]) for first, last in groups]
 
         if len(merged_splits) == 1 and self._length_function(merged_splits[0]) > self._chunk_size:
             return self._split_chunk(merged_splits[0])
@@ -74,7 +104,14 @@ class SeparatorSplitter:
 
         return merged_splits
 
-    def _split_chunk(self, chunk: List[int]) -> List[List[int]]:
+    @staticmethod
+    def _join_spans(tokens: np.ndarray, spans: List[Tuple[int, int]]) -> np.ndarray:
+        # The spans are contiguous unless the separators are dropped
+        if all(spans[i][1] == spans[i + 1][0] for i in range(len(spans) - 1)):
+            return tokens[spans[0][0]:spans[-1][1]]
+        return np.concatenate([tokens[start:end] for start, end in spans])
+
+    def _split_chunk(self, chunk: np.ndarray) -> List[np.ndarray]:
         result = []
         for i in range(0, len(chunk), self._chunk_size - self._chunk_overlap):
             new_chunk = chunk[i:i + self._chunk_size]
@@ -82,14 +119,14 @@ class SeparatorSplitter:
                 result.append(new_chunk)
         return result
 
-    def _enforce_overlap(self, chunks: List[List[int]]) -> List[List[int]]:
+    def _enforce_overlap(self, chunks: List[np.ndarray]) -> List[np.ndarray]:
         result = []
         for i, chunk in enumerate(chunks):
             if i == 0:
                 result.append(chunk)
             else:
                 overlap = chunks[i - 1][-self._chunk_overlap:]
-                new_chunk = overlap + chunk
+                new_chunk = np.concatenate([overlap, chunk])
                 if self._length_function(new_chunk) > self._chunk_size:
                     new_chunk = new_chunk[:self._chunk_size]
                 result.append(new_chunk)
@@ -66,6 +66,7 @@ DEFAULT_ENTITY_TYPES = ["organization", "person", "geo", "event"]
 DEFAULT_TUPLE_DELIMITER = "<|>"
 DEFAULT_RECORD_DELIMITER = "##"
 DEFAULT_COMPLETION_DELIMITER = "<|COMPLETE|>"
+DEFAULT_CHUNK_DELIMITER = "-----Chunk {chunk_id}-----"
 
 IGNORED_MESSAGE_ID = "0"
 
@@ -1,19 +1,26 @@
 import asyncio
+import json
+import multiprocessing
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import igraph as ig
 import numpy as np
 from lazy_object_proxy.utils import await_
+import tiktoken
 from scipy.sparse import csr_matrix
+from tqdm import tqdm
 
 from Core.Common.Logger import logger
 from typing import List
-from Core.Common.Constants import GRAPH_FIELD_SEP
+from Core.Common.Constants import GRAPH_FIELD_SEP, DEFAULT_CHUNK_DELIMITER
 from Core.Common.Memory import Memory
+from Core.Graph.EntityCanonicalizer import EntityCanonicalizer
 from Core.Prompt import GraphPrompt
 from Core.Schema.ChunkSchema import TextChunk
 from Core.Schema.EntityRelation import Entity, Relationship
-from Core.Common.Utils import (clean_str, build_data_for_merge, csr_from_indices, csr_from_indices_list)
+from Core.Common.Utils import (clean_str, build_data_for_merge, csr_from_indices, csr_from_indices_list, mdhash_id)
+from Core.Storage.JsonKVStorage import JsonKVStorage
 from Core.Storage.NetworkXStorage import NetworkXStorage
 from Core.Utils.MergeER import MergeEntity, MergeRelationship
 
@@ -26,6 +33,11 @@ class BaseGraph(ABC):
         self.llm = llm  # LLM instance
         self.ENCODER = encoder  # Encoder
         self._graph = None
+        self._summary_cache = None  # Cache of the description summaries, loaded lazily
+        self.embedding_model = None  # Embedding model, only needed by some graphs and the entity canonicalization
+        self._canonicalizer = None  # Entity name canonicalizer, loaded lazily
+        self._alias_table = None  # Persisted alias table of the canonicalizer
+        self.updated_incrementally = False  # Whether the last build_graph changed the loaded graph, its index is then stale
 
     async def build_graph(self, chunks, force: bool = False):
         """
@@ -40,6 +52,7 @@ class BaseGraph(ABC):
         # Try to load the graph
         logger.info("Starting build graph for the given documents")
 
+        self.updated_incrementally = False
         is_exist = await self._load_graph(force)
         if force or not is_exist:
             await self._clear()
@@ -47,8 +60,16 @@ class BaseGraph(ABC):
             await self._build_graph(chunks)
             # Persist the graph into file
             await self._persist_graph(force)
+        else:
+            self.updated_incrementally = await self._update_graph(chunks)
         logger.info("✅ Finished the graph building stage")
 
+    async def _update_graph(self, chunks) -> bool:
+        """
+        Update the loaded graph with the input chunks, returns whether the graph changed.
+        """
+        return False
+
     async def _load_graph(self, force: bool = False):
         """
         Try to load the graph from the file
@@ -70,86 +91,248 @@ class BaseGraph(ABC):
         return "entity_name"
 
     async def _merge_nodes_then_upsert(self, entity_name: str, nodes_data: List[Entity]):
-        existing_node = await self._graph.get_node(entity_name)
+        await self._merge_then_upsert({entity_name: nodes_data}, {})
+
+    async def _merge_edges_then_upsert(self, src_id: str, tgt_id: str, edges_data: List[Relationship]) -> None:
+        await self._merge_then_upsert({}, {(src_id, tgt_id): edges_data})
 
-        existing_data = build_data_for_merge(existing_node) if existing_node else defaultdict(list)
-        # Groups node properties by their keys for upsert operation.
-        upsert_nodes_data = defaultdict(list)
+    @staticmethod
+    def _aggregate_nodes(nodes_data: List[Entity], aggregate: dict | None = None) -> dict:
+        """
+        Fold the extracted entities of one node into its aggregate: the distinct source ids and descriptions in
+        first-seen order and the count of every entity type. Merging the aggregate gives the same node as merging the
+        entities, and aggregates fold into each other with `_combine_aggregates`.
+        """
+        if aggregate is None:
+            aggregate = dict(source_id={}, description={}, entity_type=Counter())
         for node in nodes_data:
-            for node_key, node_value in node.as_dict.items():
-                upsert_nodes_data[node_key].append(node_value)
+            aggregate["source_id"][node.source_id] = None
+            aggregate["description"][node.description] = None
+            aggregate["entity_type"][node.entity_type] += 1
+        return aggregate
 
-        merge_description = (MergeEntity.merge_descriptions(existing_data["description"],
-                                                            upsert_nodes_data[
-                                                                "description"]) if self.config.enable_entity_description else None)
+    @staticmethod
+    def _aggregate_edges(edges_data: List[Relationship], aggregate: dict | None = None) -> dict:
+        """
+        Fold the extracted relationships of one edge into its aggregate: the distinct values of every merged field in
+        first-seen order and the total weight.
+        """
+        if aggregate is None:
+            aggregate = dict(source_id={}, description={}, keywords={}, relation_name={}, weight=0.0)
+        for edge in edges_data:
+            for field_name in ("source_id", "description", "keywords", "relation_name"):
+                aggregate[field_name][getattr(edge, field_name)] = None
+            aggregate["weight"] += edge.weight
+        return aggregate
 
-        description = (
-            await self._handle_entity_relation_summary(entity_name, merge_description)
-            if merge_description
-            else ""
-        )
-        source_id = (MergeEntity.merge_source_ids(existing_data["source_id"],
-                                                  upsert_nodes_data["source_id"]))
+    @staticmethod
+    def _combine_aggregates(aggregate: dict, other: dict) -> dict:
+        # Unions the distinct values (keeping the first-seen order), adds the counts and the weights
+        for field_name, value in other.items():
+            if isinstance(value, dict):
+                aggregate[field_name].update(value)
+            else:
+                aggregate[field_name] += value
+        return aggregate
 
-        new_entity_type = (MergeEntity.merge_types(existing_data["entity_type"], upsert_nodes_data[
-            "entity_type"]) if self.config.enable_entity_type else "")
+    def _merge_node_data(self, entity_name: str, aggregate: dict, existing_node: dict | None) -> dict:
+        existing_data = defaultdict(list, build_data_for_merge(existing_node) if existing_node else {})
 
-        node_data = dict(source_id=source_id, entity_name=entity_name, entity_type=new_entity_type,
-                         description=description)
+        description = (MergeEntity.merge_descriptions(existing_data["description"], list(aggregate["description"]))
+                       if self.config.enable_entity_description else "")
 
-        # Upsert the node with the merged data
-        await self._graph.upsert_node(entity_name, node_data=node_data)
+        source_id = (MergeEntity.merge_source_ids(existing_data["source_id"], list(aggregate["source_id"])))
 
-    async def _merge_edges_then_upsert(self, src_id: str, tgt_id: str, edges_data: List[Relationship]) -> None:
-        # Check if the edge exists and fetch existing data
-        existing_edge = await self._graph.get_edge(src_id, tgt_id) if await self._graph.has_edge(src_id,
-                                                                                                 tgt_id) else None
+        new_entity_type = (MergeEntity.merge_types(existing_data["entity_type"],
+                                                   list(aggregate["entity_type"].elements()))
+                           if self.config.enable_entity_type else "")
 
-        existing_edge_data = build_data_for_merge(existing_edge) if existing_edge else defaultdict(list)
+        return dict(source_id=source_id, entity_name=entity_name, entity_type=new_entity_type,
+                    description=description)
 
-        # Groups node properties by their keys for upsert operation.
-        upsert_edge_data = defaultdict(list)
-        for edge in edges_data:
-            for edge_key, edge_value in edge.as_dict.items():
-                upsert_edge_data[edge_key].append(edge_value)
-
-        source_id = (MergeRelationship.merge_source_ids(existing_edge_data["source_id"],
-                                                        upsert_edge_data["source_id"]))
-
-        total_weight = (MergeRelationship.merge_weight(existing_edge_data["weight"],
-                                                       upsert_edge_data["weight"]))
-        merge_description = (MergeRelationship.merge_descriptions(existing_edge_data["description"],
-                                                                  upsert_edge_data[
-                                                                      "description"]) if self.config.enable_edge_description else "")
-
-        description = (
-            await self._handle_entity_relation_summary((src_id, tgt_id), merge_description)
-            if self.config.enable_edge_description
-            else ""
-        )
+    def _merge_edge_data(self, src_id: str, tgt_id: str, aggregate: dict, existing_edge: dict | None) -> dict:
+        existing_edge_data = defaultdict(list, build_data_for_merge(existing_edge) if existing_edge else {})
 
-        keywords = (MergeRelationship.merge_keywords(existing_edge_data["keywords"],
-                                                     upsert_edge_data[
-                                                         "keywords"]) if self.config.enable_edge_keywords else "")
+        source_id = (MergeRelationship.merge_source_ids(existing_edge_data["source_id"], list(aggregate["source_id"])))
+
+        total_weight = (MergeRelationship.merge_weight(existing_edge_data["weight"], [aggregate["weight"]]))
+        description = (MergeRelationship.merge_descriptions(existing_edge_data["description"],
+                                                            list(aggregate["description"]))
+                       if self.config.enable_edge_description else "")
+
+        keywords = (MergeRelationship.merge_keywords(existing_edge_data["keywords"], list(aggregate["keywords"]))
+                    if self.config.enable_edge_keywords else "")
 
         relation_name = (MergeRelationship.merge_relation_name(existing_edge_data["relation_name"],
-                                                               upsert_edge_data[
-                                                                   "relation_name"]) if self.config.enable_edge_name else "")
+                                                               list(aggregate["relation_name"]))
+                         if self.config.enable_edge_name else "")
+
+        return dict(weight=total_weight, source_id=source_id,
+                    relation_name=relation_name, keywords=keywords, description=description, src_id=src_id,
+                    tgt_id=tgt_id)
+
+    async def _merge_then_upsert(self, maybe_nodes: dict, maybe_edges: dict) -> None:
+        """
+        Merge all contributions grouped by node / edge key with the stored data, then apply them in bulk.
+
+        Args:
+            maybe_nodes: Mapping from entity name to the list of its extracted ``Entity`` objects.
+            maybe_edges: Mapping from (src_id, tgt_id) to the list of its extracted ``Relationship`` objects.
+        """
+        await self._merge_aggregates_then_upsert(
+            {entity_name: self._aggregate_nodes(nodes) for entity_name, nodes in maybe_nodes.items()},
+            {edge_key: self._aggregate_edges(edges) for edge_key, edges in maybe_edges.items()})
+
+    async def _merge_aggregates_then_upsert(self, node_aggregates: dict, edge_aggregates: dict) -> None:
+        """
+        Merge the aggregated contributions of every node / edge key with the stored data, then apply them in bulk.
+
+        Every key is read and merged exactly once, so no two coroutines can interleave on the same node or edge.
+        Only the merged descriptions that exceed the summary budget are sent to the LLM.
+
+        Args:
+            node_aggregates: Mapping from entity name to its aggregate, see `_aggregate_nodes`.
+            edge_aggregates: Mapping from (src_id, tgt_id) to its aggregate, see `_aggregate_edges`.
+        """
+        existing_nodes = await self._graph.get_node_batch(list(node_aggregates.keys()))
+        nodes_data = {
+            entity_name: self._merge_node_data(entity_name, aggregate, existing_node)
+            for (entity_name, aggregate), existing_node in zip(node_aggregates.items(), existing_nodes)
+        }
+
+        existing_edges = await self._graph.get_edge_batch(list(edge_aggregates.keys()))
+        edges_data = {
+            (src_id, tgt_id): self._merge_edge_data(src_id, tgt_id, aggregate, existing_edge)
+            for ((src_id, tgt_id), aggregate), existing_edge in zip(edge_aggregates.items(), existing_edges)
+        }
+
+        await self._summarize_descriptions(nodes_data, edges_data)
+
         # Ensure src_id and tgt_id nodes exist
-        for node_id in (src_id, tgt_id):
-            if not await self._graph.has_node(node_id):
-                # Upsert node with source_id and entity_name
-                await self._graph.upsert_node(
-                    node_id,
-                    node_data=dict(source_id=source_id, entity_name=node_id, entity_type="", description="")
-                )
-
-        # Create edge_data with merged data
-        edge_data = dict(weight=total_weight, source_id=source_id,
-                         relation_name=relation_name, keywords=keywords, description=description, src_id=src_id,
-                         tgt_id=tgt_id)
-        # Upsert the edge with the merged data
-        await self._graph.upsert_edge(src_id, tgt_id, edge_data=edge_data)
+        endpoint_source_ids = {}
+        for (src_id, tgt_id), edge_data in edges_data.items():
+            for node_id in (src_id, tgt_id):
+                if node_id not in nodes_data:
+                    endpoint_source_ids.setdefault(node_id, edge_data["source_id"])
+        endpoint_ids = list(endpoint_source_ids.keys())
+        for node_id, existing_node in zip(endpoint_ids, await self._graph.get_node_batch(endpoint_ids)):
+            if existing_node is None:
+                nodes_data[node_id] = dict(source_id=endpoint_source_ids[node_id], entity_name=node_id,
+                                           entity_type="", description="")
+
+        await self._graph.upsert_node_batch(nodes_data)
+        await self._graph.upsert_edge_batch(edges_data)
+
+    async def _summarize_descriptions(self, *merged_datas: dict) -> None:
+        """
+        Replace the over-budget merged descriptions with their LLM summaries in place.
+
+        Summaries are keyed by the hash of the node / edge key and its merged description, since the prompt names
+        the entity: repeated merges within a batch and across incremental inserts are not resummarized, and the
+        remaining descriptions are packed into batched summarization prompts.
+        """
+        keys = [(data_idx, key) for data_idx, merged_data in enumerate(merged_datas)
+                for key, data in merged_data.items() if data["description"]]
+        if not keys:
+            return
+        tokens_list = self.ENCODER.encode_batch([merged_datas[data_idx][key]["description"] for data_idx, key in keys])
+
+        # Group the over-budget descriptions by the hash of their key and description
+        pending, key_hashes = {}, {}
+        for (data_idx, key), tokens in zip(keys, tokens_list):
+            if len(tokens) < self.config.summary_max_tokens:
+                continue
+            description = merged_datas[data_idx][key]["description"]
+            desc_hash = mdhash_id(repr((key, description)), prefix="desc-")
+            key_hashes[(data_idx, key)] = desc_hash
+            pending.setdefault(desc_hash, (key, description, tokens))
+        if not pending:
+            return
+
+        summaries = await self._summarize_with_cache(pending)
+        for (data_idx, key), desc_hash in key_hashes.items():
+            merged_datas[data_idx][key]["description"] = summaries[desc_hash]
+
+    async def _summarize_with_cache(self, pending: dict) -> dict:
+        cache = await self._get_summary_cache()
+        summaries = {}
+        if cache is not None:
+            for desc_hash, cached in zip(pending, await cache.get_by_ids(list(pending.keys()))):
+                if cached is not None:
+                    summaries[desc_hash] = cached
+        to_summarize = [(desc_hash, *item) for desc_hash, item in pending.items() if desc_hash not in summaries]
+
+        packs = self._pack_descriptions(to_summarize)
+        for pack_summaries in await asyncio.gather(*[self._summarize_pack(pack) for pack in packs]):
+            summaries.update(pack_summaries)
+
+        if cache is not None:
+            await cache.upsert({desc_hash: summaries[desc_hash] for desc_hash, *_ in to_summarize})
+        logger.info(f"Summarized {len(to_summarize)} descriptions with {len(packs)} LLM calls, "
+                    f"{len(pending) - len(to_summarize)} reused from the cache")
+        return summaries
+
+    def _pack_descriptions(self, items: list) -> list[list]:
+        """
+        Greedily pack the descriptions into groups that fit the batch size and the batch token budget.
+        """
+        packs, current_pack, current_tokens = [], [], 0
+        for item in items:
+            num_tokens = min(len(item[3]), self.config.llm_model_max_token_size)
+            if current_pack and (len(current_pack) >= self.config.summary_batch_size
+                                 or current_tokens + num_tokens > self.config.summary_batch_max_tokens):
+                packs.append(current_pack)
+                current_pack, current_tokens = [], 0
+            current_pack.append(item)
+            current_tokens += num_tokens
+        if current_pack:
+            packs.append(current_pack)
+        return packs
+
+    async def _summarize_pack(self, pack: list) -> dict:
+        """
+        Summarize a pack of descriptions with one structured prompt, the items missing from the response are
+        summarized one by one.
+        """
+        if len(pack) == 1:
+            desc_hash, name, description, tokens = pack[0]
+            return {desc_hash: await self._handle_entity_relation_summary(name, description, tokens)}
+
+        items = [
+            dict(id=str(idx),
+                 entities=name if isinstance(name, str) else ", ".join(name),
+                 description_list=self.ENCODER.decode(tokens[:self.config.llm_model_max_token_size]).split(
+                     GRAPH_FIELD_SEP))
+            for idx, (_, name, _, tokens) in enumerate(pack)
+        ]
+        use_prompt = GraphPrompt.SUMMARIZE_ENTITY_DESCRIPTIONS_BATCH.format(
+            items=json.dumps(items, ensure_ascii=False, indent=2))
+
+        summaries = {}
+        try:
+            response = await self.llm.aask(use_prompt, max_tokens=self.config.summary_max_tokens * len(pack),
+                                           format="json")
+            for item in response.get("summaries", []):
+                idx, summary = str(item.get("id", "")), item.get("summary")
+                if idx.isdigit() and int(idx) < len(pack) and isinstance(summary, str) and summary.strip():
+                    summaries[pack[int(idx)][0]] = summary.strip()
+        except Exception as e:
+            logger.warning(f"Batched summarization failed, falling back to one call per description: {e}")
+
+        missing = [item for item in pack if item[0] not in summaries]
+        fallback = await asyncio.gather(
+            *[self._handle_entity_relation_summary(name, description, tokens) for _, name, description, tokens in
+              missing])
+        summaries.update({desc_hash: summary for (desc_hash, *_), summary in zip(missing, fallback)})
+        return summaries
+
+    async def _get_summary_cache(self):
+        if not self.config.enable_summary_cache or self._graph.namespace is None:
+            return None
+        if self._summary_cache is None:
+            self._summary_cache = JsonKVStorage(self._graph.namespace, "summary_cache")
+            await self._summary_cache.load()
+        return self._summary_cache
 
     @abstractmethod
     def _extract_entity_relationship(self, chunk_key_pair: tuple[str, TextChunk]):
@@ -175,24 +358,25 @@ class BaseGraph(ABC):
     async def augment_graph_by_similarity_search(self, entity_vdb, duplicate=False):
         logger.info("Starting augment the existing graph with similariy edges")
 
-        # ranking =  for node in
-        #       await self._graph.nodes()}
-
-        ranking  = {}
-        import tqdm
-        for node in tqdm.tqdm(await self._graph.nodes(), total=len(await self._graph.nodes())):
-            ranking[node] =  await entity_vdb.retrieval(query = node, top_k=self.config.similarity_top_k)
-      
-        kb_similarity = defaultdict(list)
-        for key, rank in ranking.items():
-            max_score = 0
-            for idx, ns_item in enumerate(rank):
-                score = ns_item.score
-                if idx == 0:
-                    max_score = score
-                if not duplicate and idx == 0:
-                    continue
-                kb_similarity[key].append((ns_item.metadata['entity_name'], score / max_score))
+        embedding_matrix = await entity_vdb.get_embedding_matrix("entity_name")
+        if embedding_matrix is not None:
+            kb_similarity = self._similarity_knn(*embedding_matrix, duplicate=duplicate)
+        else:
+            # The index does not expose its embeddings, so fall back to one retrieval per node
+            ranking = {}
+            for node in tqdm(await self._graph.nodes(), total=len(await self._graph.nodes())):
+                ranking[node] = await entity_vdb.retrieval(query=node, top_k=self.config.similarity_top_k)
+
+            kb_similarity = defaultdict(list)
+            for key, rank in ranking.items():
+                max_score = 0
+                for idx, ns_item in enumerate(rank):
+                    score = ns_item.score
+                    if idx == 0:
+                        max_score = score
+                    if not duplicate and idx == 0:
+                        continue
+                    kb_similarity[key].append((ns_item.metadata['entity_name'], score / max_score))
 
         maybe_edges = defaultdict(list)
         # Refactored second part using dictionary iteration and enumerate
@@ -218,49 +402,301 @@ class BaseGraph(ABC):
         for k, v in maybe_edges.items():
             maybe_edges_aug[tuple(sorted(k))].extend(v)
         logger.info(f"Augmenting graph with {len(maybe_edges_aug)} edges")
-     
-        await asyncio.gather(*[self._merge_edges_then_upsert(k[0], k[1], v) for k, v in maybe_edges.items()])
+
+        await self._merge_then_upsert({}, maybe_edges_aug)
         await self._persist_graph()
         logger.info("✅ Finished augment the existing graph with similariy edges")
 
 
+    def _similarity_knn(self, entity_names: list[str], embeddings: np.ndarray, duplicate=False):
+        """
+        Batched cosine kNN of every entity against the whole entity embedding matrix.
+
+        The similarity matrix is computed by blocks of `similarity_block_size` rows so the memory stays bounded.
+        As in the retrieval based search, the top_k neighbours include the entity itself, and the scores
+        are normalized by the best score of each row.
+        """
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+        num_entities = len(entity_names)
+        top_k = min(self.config.similarity_top_k, num_entities)
+
+        kb_similarity = defaultdict(list)
+        for start in tqdm(range(0, num_entities, self.config.similarity_block_size)):
+            block_scores = embeddings[start: start + self.config.similarity_block_size] @ embeddings.T
+            top_indices = np.argpartition(-block_scores, top_k - 1, axis=1)[:, :top_k]
+            top_scores = np.take_along_axis(block_scores, top_indices, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top_indices = np.take_along_axis(top_indices, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            max_scores = top_scores[:, :1]
+            top_scores = np.divide(top_scores, max_scores, out=np.zeros_like(top_scores), where=max_scores > 0)
+
+            for row, (indices, scores) in enumerate(zip(top_indices, top_scores)):
+                src_id = entity_names[start + row]
+                for idx, (nn_idx, score) in enumerate(zip(indices, scores)):
+                    if not duplicate and idx == 0:
+                        continue
+                    if score < self.config.similarity_threshold:
+                        break
+                    kb_similarity[src_id].append((entity_names[nn_idx], float(score)))
+        return kb_similarity
+
+    async def _extract_and_merge(self, chunk_list):
+        """
+        Stream the chunks through a bounded producer/consumer pipeline.
+
+        A producer feeds a bounded queue, ``max_inflight_chunks`` extraction workers consume it, and a single merger
+        folds every ``merge_batch_size`` extracted results into the graph storage. Only a bounded number of chunks and
+        intermediate results are alive at any time, so peak memory does not grow with the corpus size.
+
+        Args:
+            chunk_list: An iterable of (chunk_key, TextChunk) pairs.
+        """
+        if self.config.build_shards > 1:
+            return await self._extract_and_merge_sharded(list(chunk_list))
+
+        num_workers = max(1, self.config.max_inflight_chunks)
+        chunk_queue = asyncio.Queue(maxsize=num_workers)
+        result_queue = asyncio.Queue(maxsize=num_workers)
+        total = len(chunk_list) if hasattr(chunk_list, "__len__") else None
+        progress = tqdm(total=total, desc="Extracting chunks")
+
+        async def _produce():
+            for chunk_pack in self._pack_chunks(chunk_list):
+                await chunk_queue.put(chunk_pack)
+            for _ in range(num_workers):
+                await chunk_queue.put(None)
+
+        async def _extract():
+            while (chunk_pack := await chunk_queue.get()) is not None:
+                try:
+                    results = await self._extract_entity_relationship_batch(chunk_pack)
+                except Exception as e:
+                    # A failed chunk is skipped instead of aborting the whole build
+                    logger.exception(f"Error extracting chunks {[chunk_key for chunk_key, _ in chunk_pack]}: {e}")
+                    continue
+                finally:
+                    progress.update(len(chunk_pack))
+                for result in results:
+                    await result_queue.put(result)
+
+        async def _merge():
+            batch = []
+            while (result := await result_queue.get()) is not None:
+                batch.append(result)
+                if len(batch) >= self.config.merge_batch_size:
+                    await self.__graph__(batch)
+                    batch = []
+            if batch:
+                await self.__graph__(batch)
+
+        async def _extract_all():
+            await asyncio.gather(_produce(), *[_extract() for _ in range(num_workers)])
+            await result_queue.put(None)
+
+        tasks = [asyncio.create_task(_extract_all()), asyncio.create_task(_merge())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # If one side fails, the other one would block forever on the bounded queues
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            progress.close()
+        logger.info(f"Processed {progress.n} chunks, the graph now has {self.node_num} nodes and {self.edge_num} edges")
+
+    async def _extract_and_merge_sharded(self, chunk_list):
+        """
+        Map-reduce build over ``build_shards`` worker processes.
+
+        The chunks are split into contiguous shards of ``merge_batch_size`` chunks. Every shard is extracted in a
+        worker process with its own LLM client and event loop, which folds the extracted elements into one aggregate
+        per node / edge key (map). At most two shards per worker are in flight, and their aggregates are merged into
+        the graph storage one shard at a time in shard order (reduce), so the memory stays bounded and the result
+        does not depend on which worker finishes first.
+        """
+        num_workers = self.config.build_shards
+        shard_size = max(1, self.config.merge_batch_size)
+        # Only the fields needed by the extraction are sent, a mapped chunk would pickle its whole text buffer
+        shards = ([(chunk_key, chunk_info.content, chunk_info.tokens)
+                   for chunk_key, chunk_info in chunk_list[start: start + shard_size]]
+                  for start in range(0, len(chunk_list), shard_size))
+
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+        pending = deque()
+        num_shards = 0
+        try:
+            for shard in shards:
+                pending.append(loop.run_in_executor(pool, _extract_graph_shard, type(self), self.config,
+                                                    self.llm.config, self.ENCODER.name, shard))
+                num_shards += 1
+                if len(pending) >= 2 * num_workers:
+                    await self._reduce_shard(await pending.popleft())
+            while pending:
+                await self._reduce_shard(await pending.popleft())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        logger.info(f"Processed {len(chunk_list)} chunks in {num_shards} shards, "
+                    f"the graph now has {self.node_num} nodes and {self.edge_num} edges")
+
+    async def _reduce_shard(self, shard_result):
+        (node_aggregates, edge_aggregates), stats, (prompt_tokens, completion_tokens) = shard_result
+        self._merge_extraction_stats(stats)
+        if self.llm.cost_manager is not None:
+            self.llm.cost_manager.update_cost(prompt_tokens, completion_tokens, self.llm.config.model)
+        await self._reduce_aggregates(node_aggregates, edge_aggregates)
+
+    async def _extract_shard(self, chunk_list):
+        """
+        Map step of the sharded build: extract the chunks of one shard and fold the elements into one aggregate per
+        node / edge key.
+        """
+        semaphore = asyncio.Semaphore(max(1, self.config.max_inflight_chunks))
+
+        async def _extract(chunk_pack):
+            async with semaphore:
+                try:
+                    return await self._extract_entity_relationship_batch(chunk_pack)
+                except Exception as e:
+                    # A failed chunk is skipped instead of aborting the whole build
+                    logger.exception(f"Error extracting chunks {[chunk_key for chunk_key, _ in chunk_pack]}: {e}")
+                    return []
+
+        results = await asyncio.gather(*[_extract(chunk_pack) for chunk_pack in self._pack_chunks(chunk_list)])
+        return self._aggregate_elements([result for pack_results in results for result in pack_results])
+
+    def _extraction_stats(self) -> dict:
+        """
+        Statistics collected by the extraction, returned by the workers of the sharded build.
+        """
+        return {}
+
+    def _merge_extraction_stats(self, stats: dict):
+        """
+        Merge the extraction statistics of a worker of the sharded build.
+        """
+        pass
+
+    def _pack_chunks(self, chunk_list):
+        """
+        Group consecutive chunks into packs whose total token count fits ``chunk_pack_max_tokens``.
+
+        Chunks larger than the budget form a pack on their own. When packing is disabled, every chunk is its own pack.
+        """
+        max_tokens = self.config.chunk_pack_max_tokens
+        chunk_pack, pack_tokens = [], 0
+        for chunk in chunk_list:
+            chunk_tokens = chunk[1].tokens
+            if chunk_pack and pack_tokens + chunk_tokens > max_tokens:
+                yield chunk_pack
+                chunk_pack, pack_tokens = [], 0
+            chunk_pack.append(chunk)
+            pack_tokens += chunk_tokens
+        if chunk_pack:
+            yield chunk_pack
+
+    async def _extract_entity_relationship_batch(self, chunk_key_pairs: list[tuple[str, TextChunk]]) -> list:
+        """
+        Extract the entities and relationships of a pack of chunks, returning one result per chunk.
+
+        Graphs that support packing several chunks into one extraction call override this method.
+        """
+        return await asyncio.gather(*[self._extract_entity_relationship(chunk) for chunk in chunk_key_pairs])
+
+    @staticmethod
+    def _format_packed_chunks(contents: list[str]) -> str:
+        return "\n\n".join(
+            f"{DEFAULT_CHUNK_DELIMITER.format(chunk_id=idx)}\n{content}" for idx, content in enumerate(contents))
+
     async def __graph__(self, elements: list):
         """
         Build the graph based on the input elements.
         """
-        # Initialize dictionaries to hold aggregated node and edge information
-        maybe_nodes, maybe_edges = defaultdict(list), defaultdict(list)
+        await self._reduce_aggregates(*self._aggregate_elements(elements))
+
+    async def _reduce_aggregates(self, node_aggregates: dict, edge_aggregates: dict):
+        """
+        Canonicalize the aggregated nodes and edges if enabled, then merge them into the graph storage.
+        """
+        if self.config.enable_entity_canonicalization:
+            node_aggregates, edge_aggregates = await self._canonicalize_entities(node_aggregates, edge_aggregates)
+
+        # Merge the aggregated nodes and edges, then bulk upsert them
+        await self._merge_aggregates_then_upsert(node_aggregates, edge_aggregates)
+
+    def _aggregate_elements(self, elements: list):
+        """
+        Fold the extracted (nodes, edges) tuples into one aggregate per node / edge key.
+        """
+        node_aggregates, edge_aggregates = {}, {}
 
         # Iterate through each tuple of nodes and edges in the input elements
         for m_nodes, m_edges in elements:
-            # Aggregate node information
             for k, v in m_nodes.items():
-                maybe_nodes[k].extend(v)
+                node_aggregates[k] = self._aggregate_nodes(v, node_aggregates.get(k))
 
-            # Aggregate edge information
             for k, v in m_edges.items():
-                maybe_edges[tuple(sorted(k))].extend(v)
+                edge_key = tuple(sorted(k))
+                edge_aggregates[edge_key] = self._aggregate_edges(v, edge_aggregates.get(edge_key))
+        return node_aggregates, edge_aggregates
 
-        # Asynchronously merge and upsert nodes
-        await asyncio.gather(*[self._merge_nodes_then_upsert(k, v) for k, v in maybe_nodes.items()])
-
-        # Asynchronously merge and upsert edges
-        await asyncio.gather(*[self._merge_edges_then_upsert(k[0], k[1], v) for k, v in maybe_edges.items()])
-
-    async def _handle_entity_relation_summary(self, entity_or_relation_name: str, description: str) -> str:
+    async def _canonicalize_entities(self, node_aggregates, edge_aggregates):
+        """
+        Rename the aggregated entities (and the endpoints of the edges) to their canonical names, the aggregates of
+        the aliases of one entity are combined.
+        """
+        canonicalizer = await self._get_canonicalizer()
+        names = list(node_aggregates.keys()) + [name for edge_key in edge_aggregates for name in edge_key]
+        mapping = await canonicalizer.canonicalize(names)
+
+        canonical_nodes, canonical_edges = {}, {}
+        for entity_name, aggregate in node_aggregates.items():
+            canonical_name = mapping[entity_name]
+            if canonical_name in canonical_nodes:
+                self._combine_aggregates(canonical_nodes[canonical_name], aggregate)
+            else:
+                canonical_nodes[canonical_name] = aggregate
+        for (src_id, tgt_id), aggregate in edge_aggregates.items():
+            if mapping[src_id] == mapping[tgt_id]:
+                # Both endpoints are aliases of the same entity
+                continue
+            edge_key = tuple(sorted((mapping[src_id], mapping[tgt_id])))
+            if edge_key in canonical_edges:
+                self._combine_aggregates(canonical_edges[edge_key], aggregate)
+            else:
+                canonical_edges[edge_key] = aggregate
+        return canonical_nodes, canonical_edges
+
+    async def _get_canonicalizer(self):
+        if self._canonicalizer is None:
+            self._canonicalizer = EntityCanonicalizer(self.config, self.embedding_model)
+            aliases = {}
+            if self._graph.namespace is not None:
+                self._alias_table = JsonKVStorage(self._graph.namespace, "entity_alias")
+                await self._alias_table.load()
+                aliases = {alias: data["canonical_name"] for alias, data in self._alias_table.json_data.items()}
+            self._canonicalizer.load(await self._graph.nodes(), aliases)
+        return self._canonicalizer
+
+    async def _handle_entity_relation_summary(self, entity_or_relation_name: str, description: str,
+                                              tokens: list[int] = None) -> str:
         """
            Generate a summary for an entity or relationship.
 
            Args:
                entity_or_relation_name (str): The name of the entity or relationship.
                description (str): The detailed description of the entity or relationship.
+               tokens (list[int], optional): The already encoded description, to avoid encoding it again.
 
            Returns:
                str: The generated summary.
         """
 
         # Encode the description into tokens
-        tokens = self.ENCODER.encode(description)
+        if tokens is None:
+            tokens = self.ENCODER.encode(description)
 
         # Check if the token length is within the maximum allowed tokens for summarization
         if len(tokens) < self.config.summary_max_tokens:
@@ -281,10 +717,22 @@ class BaseGraph(ABC):
 
     async def _persist_graph(self, force = False):
         await self._graph.persist(force)
+        if self._summary_cache is not None:
+            await self._summary_cache.persist()
+        if self._alias_table is not None:
+            await self._alias_table.upsert({alias: {"canonical_name": canonical_name} for alias, canonical_name in
+                                            self._canonicalizer.alias_table.items()})
+            await self._alias_table.persist()
 
     async def nodes_data(self):
         return await self._graph.get_nodes_data()
 
+    async def node_embeddings(self):
+        """
+        The embeddings of the nodes in the order of `nodes_data`, or None if the graph does not compute them.
+        """
+        return None
+
     async def edges_data(self, need_content=True):
         return await self._graph.get_edges_data(need_content)
 
@@ -459,3 +907,24 @@ class BaseGraph(ABC):
     async def _clear(self):
         self._graph.clear()
 
+
+def _extract_graph_shard(graph_cls, graph_config, llm_config, encoding_name, chunk_list):
+    """
+    Entry point of a worker process of the sharded build, the chunks are (chunk_key, content, tokens) tuples. It
+    returns the node / edge aggregates of the shard, the extraction statistics and the (prompt, completion) token
+    usage of its LLM client.
+    """
+    # Imported here to keep the provider dependencies out of the graph module, importing Core.Provider also
+    # registers the providers in the fresh interpreter of the worker process
+    import Core.Provider  # noqa: F401
+    from Core.Common.CostManager import CostManager
+    from Core.Provider.LLMProviderRegister import create_llm_instance
+
+    llm = create_llm_instance(llm_config)
+    llm.cost_manager = CostManager()
+    graph = graph_cls(graph_config, llm, tiktoken.get_encoding(encoding_name))
+    chunk_list = [(chunk_key, TextChunk(tokens=tokens, chunk_id=chunk_key, content=content, doc_id=None, index=None))
+                  for chunk_key, content, tokens in chunk_list]
+    partial = asyncio.run(graph._extract_shard(chunk_list))
+    return partial, graph._extraction_stats(), (llm.cost_manager.total_prompt_tokens,
+                                                llm.cost_manager.total_completion_tokens)
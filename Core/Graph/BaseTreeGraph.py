@@ -0,0 +1,155 @@
+from Core.Graph.BaseGraph import BaseGraph
+from Core.Graph.TreeInsertion import TreeLeafInserter
+from Core.Schema.ChunkSchema import TextChunk
+from Core.Common.Logger import logger
+from Core.Index.EmbeddingFactory import get_rag_embedding
+from Core.Prompt.RaptorPrompt import SUMMARIZE
+from Core.Storage.TreeGraphStorage import TreeGraphStorage
+from Core.Schema.TreeSchema import TreeNode
+
+import asyncio
+import random
+from abc import abstractmethod
+
+from typing import List, Set, Any
+
+Embedding = List[float]
+
+
+class BaseTreeGraph(BaseGraph):
+    """
+    Base class of the RAPTOR trees: the node creation, the summarization and embedding of the layers, the layer-wise
+    construction from the leaves, the incremental insertion and the layer-wise retrieval. The subclasses only differ
+    by how a layer is clustered.
+    """
+
+    def __init__(self, config, llm, encoder):
+        super().__init__(config, llm, encoder)
+        self._graph: TreeGraphStorage = TreeGraphStorage()  # Tree index
+        self.embedding_model = get_rag_embedding(config.embedding.api_type, config)  # Embedding model
+        self.config = config.graph # Only keep the graph config
+        random.seed(self.config.random_seed)
+
+    @abstractmethod
+    async def _cluster_layer(self, nodes: List[TreeNode]) -> List[List[TreeNode]]:
+        """
+        Cluster the nodes of a layer, every cluster becomes a node of the next layer.
+        """
+        pass
+
+    def _close_clustering(self):
+        """
+        Release the resources of the clustering, called once the tree is built.
+        """
+        pass
+
+    async def _create_node_without_embedding(self, layer: int, text: str, children_indices: Set[int] = None):
+        # The node is embedded with the whole layer by _batch_embed_and_assign
+        logger.info(
+            "Create node_id = unassigned, children = {children}".format(node_id=0, children=children_indices))
+        return self._graph.upsert_node(node_id=0,
+                                       node_data={"layer": layer, "text": text, "children": children_indices,
+                                                  "embedding": []})
+
+    async def _extract_entity_relationship(self, chunk_key_pair: tuple[str, TextChunk]) -> TreeNode:
+        # Build a leaf node from a text chunk
+        chunk_key, chunk_info = chunk_key_pair
+        leaf_node = await self._create_node_without_embedding(0, chunk_info.content)
+        return leaf_node
+
+    async def _summarize_clusters(self, clusters: List[List[TreeNode]]) -> List[str]:
+        # Summarize all the clusters of a layer concurrently, bounded by the summary semaphore
+        semaphore = asyncio.Semaphore(self.config.summary_max_concurrency)
+
+        async def _summarize(cluster):
+            async with semaphore:
+                return await self._summarize_from_cluster(cluster, self.config.summarization_length)
+
+        return await asyncio.gather(*[_summarize(cluster) for cluster in clusters])
+
+    async def _summarize_from_cluster(self, node_list: List[TreeNode], summarization_length=150) -> str:
+        # Give a summarization from a cluster of nodes
+        node_texts = f"\n\n".join([' '.join(node.text.splitlines()) for node in node_list])
+        content = SUMMARIZE.format(context=node_texts)
+        return await self.llm.aask(content, max_tokens=summarization_length)
+
+    async def _embed_texts(self, texts: List[str]) -> List[Embedding]:
+        # Embed the texts in batches, the batches are sent concurrently and the order of the texts is kept
+        batch_size = self.embedding_model.embed_batch_size
+        semaphore = asyncio.Semaphore(self.config.embedding_max_concurrency)
+
+        async def _embed_batch(batch):
+            async with semaphore:
+                return await self.embedding_model._aget_text_embeddings(batch)
+
+        batches = await asyncio.gather(
+            *[_embed_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+        return [embedding for batch in batches for embedding in batch]
+
+    async def _batch_embed_and_assign(self, layer):
+        current_layer = self._graph.get_layer(layer)
+        embeddings = await self._embed_texts([node.text for node in current_layer])
+        # The nodes of the current layer are the last ones of all the nodes
+        start_id = self._graph.get_node_num() - len(current_layer)
+        for offset, (node, embedding) in enumerate(zip(current_layer, embeddings)):
+            node.index = start_id + offset
+            node.embedding = embedding
+
+    async def _create_leaves(self, chunks: List[Any]):
+        self._graph.clear()  # clear the storage before rebuilding
+        self._graph.add_layer()
+        for chunk in chunks:
+            await self._extract_entity_relationship(chunk_key_pair=chunk)
+        logger.info(len(chunks))
+        logger.info(f"To batch embed leaves")
+        await self._batch_embed_and_assign(self._graph.num_layers - 1)
+        logger.info(f"Created {len(self._graph.leaf_nodes)} Leaf Embeddings")
+        await self._graph.write_tree_leaves()
+
+    async def _build_tree_from_leaves(self):
+        for layer in range(self.config.num_layers):  # build a new layer
+            logger.info("length of layer: {length}".format(length=len(self._graph.get_layer(layer))))
+            if len(self._graph.get_layer(layer)) <= self.config.reduction_dimension + 1:
+                break
+
+            self._graph.add_layer()
+
+            clusters = await self._cluster_layer(self._graph.get_layer(layer))
+
+            summaries = await self._summarize_clusters(clusters)
+            for cluster, summarized_text in zip(clusters, summaries):
+                await self._create_node_without_embedding(layer + 1, summarized_text,
+                                                          {node.index for node in cluster})
+
+            logger.info("To batch embed current layer")
+            await self._batch_embed_and_assign(self._graph.num_layers - 1)
+
+            logger.info("Layer: {layer}".format(layer=layer))
+
+        logger.info(self._graph.num_layers)
+
+    async def _update_graph(self, chunks) -> bool:
+        if not self.config.tree_incremental:
+            return False
+        # Insert the new chunks into the loaded tree instead of rebuilding it
+        logger.info("Starting incremental insertion into the loaded tree")
+        try:
+            updated = await TreeLeafInserter(self).insert(chunks)
+        finally:
+            self._close_clustering()
+        if updated:
+            await self._persist_graph(force=True)
+        return updated
+
+    async def node_embeddings(self):
+        # The tree nodes are embedded during the construction, the vector index reuses them
+        return self._graph.embedding_matrix
+
+    async def traverse_tree(self, query: str, beam_width: int, layer_top_k: int) -> List[TreeNode]:
+        # Layer-wise retrieval from the root layer down, an alternative to the collapsed-tree vector search
+        query_embedding = await self.embedding_model._aget_text_embedding(query)
+        return self._graph.traverse(query_embedding, beam_width, layer_top_k)
+
+    @property
+    def entity_metakey(self):
+        return "index"
@@ -16,7 +16,8 @@ from Core.Prompt.Base import TextPrompt
 from Core.Schema.EntityRelation import Entity, Relationship
 from Core.Common.Constants import (
     NODE_PATTERN,
-    REL_PATTERN
+    REL_PATTERN,
+    DEFAULT_CHUNK_DELIMITER
 )
 from Core.Storage.NetworkXStorage import NetworkXStorage
 
@@ -54,14 +55,29 @@ class ERGraph(BaseGraph):
 
         return triples
 
+    async def _fused_ner_openie_extract(self, passage: str):
+        fused_messages = GraphPrompt.NER_OPENIE_FUSED.format(user_input=passage)
+        response = await self.llm.aask(fused_messages, format="json")
+
+        entities = response.get("named_entities", []) if isinstance(response, dict) else []
+        triples = response.get("triples", []) if isinstance(response, dict) else []
+        if not isinstance(entities, list):
+            entities = []
+        if not isinstance(triples, list):
+            triples = []
+        return entities, triples
+
     async def _extract_entity_relationship(self, chunk_key_pair: tuple[str, TextChunk]) -> Any:
         chunk_key, chunk_info = chunk_key_pair  # Unpack the chunk key and information
         chunk_info = chunk_info.content
         if self.config.extract_two_step:
             # Extract entities and relationships using OPEN-IE for HippoRAG
             # Refer to: https://github.com/OSU-NLP-Group/HippoRAG/blob/main/src/
-            entities = await self._named_entity_recognition(chunk_info)
-            triples = await self._openie_post_ner_extract(chunk_info, entities)
+            if self.config.extract_fused:
+                entities, triples = await self._fused_ner_openie_extract(chunk_info)
+            else:
+                entities = await self._named_entity_recognition(chunk_info)
+                triples = await self._openie_post_ner_extract(chunk_info, entities)
             return await self._build_graph_from_tuples(entities, triples, chunk_key)
         else:
             # Use KGAgent from camel for one-step entity and relationship extraction (used in MedicalRAG)
@@ -69,6 +85,62 @@ class ERGraph(BaseGraph):
             graph_element = await self._kg_agent(chunk_info)
             return await self._build_graph_by_regular_matching(graph_element, chunk_key)
 
+    async def _extract_entity_relationship_batch(self, chunk_key_pairs: list[tuple[str, TextChunk]]):
+        if len(chunk_key_pairs) == 1 or not self.config.extract_two_step:
+            # Only the two-step (NER + OpenIE) extraction supports chunk packing
+            return await super()._extract_entity_relationship_batch(chunk_key_pairs)
+
+        num_chunks = len(chunk_key_pairs)
+        chunk_delimiter = DEFAULT_CHUNK_DELIMITER.format(chunk_id="<chunk_id>")
+        passage = self._format_packed_chunks([chunk_info.content for _, chunk_info in chunk_key_pairs])
+
+        if self.config.extract_fused:
+            fused_messages = GraphPrompt.NER_OPENIE_FUSED.format(user_input=passage)
+            fused_messages += GraphPrompt.NER_OPENIE_FUSED_PACKED.format(num_chunks=num_chunks,
+                                                                        chunk_delimiter=chunk_delimiter)
+            response = await self.llm.aask(fused_messages, format="json")
+            entities_per_chunk = self._split_json_by_chunk(response, "named_entities", num_chunks)
+            triples_per_chunk = self._split_json_by_chunk(response, "triples", num_chunks)
+            return await self._build_packed_results(chunk_key_pairs, entities_per_chunk, triples_per_chunk)
+
+        ner_messages = GraphPrompt.NER.format(user_input=passage) + GraphPrompt.NER_PACKED.format(
+            num_chunks=num_chunks, chunk_delimiter=chunk_delimiter)
+        entities_per_chunk = self._split_json_by_chunk(await self.llm.aask(ner_messages, format="json"),
+                                                       "named_entities", num_chunks)
+
+        named_entity_json = {"chunks": [{"id": str(idx), "named_entities": entities or []}
+                                        for idx, entities in enumerate(entities_per_chunk)]}
+        openie_messages = GraphPrompt.OPENIE_POST_NET.format(passage=passage,
+                                                             named_entity_json=json.dumps(named_entity_json))
+        openie_messages += GraphPrompt.OPENIE_POST_NER_PACKED.format(num_chunks=num_chunks,
+                                                                     chunk_delimiter=chunk_delimiter)
+        triples_per_chunk = self._split_json_by_chunk(await self.llm.aask(openie_messages, format="json"),
+                                                      "triples", num_chunks)
+        return await self._build_packed_results(chunk_key_pairs, entities_per_chunk, triples_per_chunk)
+
+    async def _build_packed_results(self, chunk_key_pairs, entities_per_chunk, triples_per_chunk):
+        # The chunks missing from the packed response are extracted on their own, concurrently
+        return await asyncio.gather(*[
+            self._extract_entity_relationship(chunk_key_pair) if entities is None or triples is None else
+            self._build_graph_from_tuples(entities, triples, chunk_key_pair[0])
+            for chunk_key_pair, entities, triples in zip(chunk_key_pairs, entities_per_chunk, triples_per_chunk)])
+
+    @staticmethod
+    def _split_json_by_chunk(response, key: str, num_chunks: int) -> list:
+        """
+        Split a packed JSON response of the form {"chunks": [{"id": ..., key: [...]}]} back to the chunks,
+        the chunks missing from the response are None.
+        """
+        results = [None] * num_chunks
+        chunks = response.get("chunks", []) if isinstance(response, dict) else []
+        for item in chunks if isinstance(chunks, list) else []:
+            if not isinstance(item, dict):
+                continue
+            chunk_id = str(item.get("id", ""))
+            if chunk_id.isdigit() and int(chunk_id) < num_chunks and isinstance(item.get(key), list):
+                results[int(chunk_id)] = item[key]
+        return results
+
     async def _kg_agent(self, chunk_info):
         knowledge_graph_prompt = TextPrompt(GraphPrompt.KG_AGNET)
         knowledge_graph_generation = knowledge_graph_prompt.format(
@@ -82,10 +154,8 @@ class ERGraph(BaseGraph):
 
     async def _build_graph(self, chunk_list: List[Any]):
         try:
-            results = await asyncio.gather(
-                *[self._extract_entity_relationship(chunk) for chunk in chunk_list])
-            # Build graph based on the extracted entities and triples
-            await self.__graph__(results)
+            # Extract the chunks and merge them into the graph incrementally
+            await self._extract_and_merge(chunk_list)
         except Exception as e:
             logger.exception(f"Error building graph: {e}")
         finally:
@@ -0,0 +1,192 @@
+"""
+Entity canonicalization, which maps the surface variants of one entity (e.g., "U.S." and "United States") to a
+single canonical name before the extracted entities are merged into the graph.
+
+Candidate pairs are generated cheaply by MinHash/LSH over the character shingles of the names, plus a blocked top-k
+nearest neighbour search over the embeddings of the names seen by the canonicalizer when an embedding model is
+available (the names of an existing graph are only blocked by MinHash, they are not re-embedded). The pairs above the thresholds
+are merged through a union-find, and the resulting alias table is persisted next to the graph.
+"""
+import asyncio
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from Core.Common.Logger import logger
+
+MINHASH_NUM_PERM = 64  # Number of the MinHash permutations
+MINHASH_NUM_BANDS = 16  # Number of the LSH bands, each band hashes MINHASH_NUM_PERM // MINHASH_NUM_BANDS rows
+SHINGLE_SIZE = 3
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+class EntityCanonicalizer:
+    """
+    Incremental union-find over the entity names.
+
+    Names that are already nodes of the graph are "committed": a new name may join the cluster of a committed
+    name, but two committed names are never merged, so the existing nodes of the graph never have to be renamed.
+    """
+
+    def __init__(self, config, embedding_model=None):
+        self.config = config
+        self.embedding_model = embedding_model if config.canonicalization_use_embedding else None
+        rng = np.random.RandomState(config.canonicalization_seed)
+        self._perm_a = rng.randint(1, _MERSENNE_PRIME, size=MINHASH_NUM_PERM, dtype=np.int64)
+        self._perm_b = rng.randint(0, _MERSENNE_PRIME, size=MINHASH_NUM_PERM, dtype=np.int64)
+
+        self._names: list[str] = []
+        self._name_ids: dict[str, int] = {}
+        self._parent: list[int] = []
+        self._committed: list[bool] = []
+        self._shingles: list[set[str]] = []
+        self._lsh_buckets: dict[tuple[int, bytes], list[int]] = defaultdict(list)
+        self._embeddings = None  # Normalized embeddings of the embedded names, one row per name of _embedded_ids
+        self._embedded_ids: list[int] = []
+        self._embedding_rows: dict[int, int] = {}
+
+    def load(self, graph_nodes: list[str], aliases: dict[str, str]):
+        """
+        Restore the state from the nodes of an existing graph and its persisted alias table.
+        """
+        self._add_names(sorted(graph_nodes), committed=True)
+        for alias, canonical_name in sorted(aliases.items()):
+            if alias in self._name_ids or canonical_name not in self._name_ids:
+                continue
+            self._add_names([alias], committed=False)
+            self._parent[self._name_ids[alias]] = self._find(self._name_ids[canonical_name])
+
+    @property
+    def alias_table(self) -> dict[str, str]:
+        """
+        Map every alias to its canonical name, canonical names are not included.
+        """
+        return {name: self._names[self._find(idx)] for idx, name in enumerate(self._names) if
+                self._find(idx) != idx}
+
+    async def canonicalize(self, names: list[str]) -> dict[str, str]:
+        """
+        Return the canonical name of every input name, the names seen for the first time are matched against
+        all the known names.
+        """
+        new_names = sorted(set(name for name in names if name not in self._name_ids))
+        if len(new_names) > 0:
+            start = len(self._names)
+            self._add_names(new_names, committed=False)
+            if self.embedding_model is not None:
+                await self._add_embeddings(list(range(start, len(self._names))))
+
+            pairs = self._score_pairs(self._candidate_pairs(start))
+            for score, i, j in sorted(pairs, key=lambda item: (-item[0], item[1], item[2])):
+                self._union(i, j)
+            logger.info(f"Canonicalized {len(new_names)} new entity names, {len(pairs)} candidate pairs merged")
+
+        mapping = {}
+        for name in names:
+            root = self._find(self._name_ids[name])
+            # The canonical name becomes a node of the graph from now on
+            self._committed[root] = True
+            mapping[name] = self._names[root]
+        return mapping
+
+    def _add_names(self, names: list[str], committed: bool):
+        for name in names:
+            idx = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = idx
+            self._parent.append(idx)
+            self._committed.append(committed)
+            shingles = self._shingle(name)
+            self._shingles.append(shingles)
+            for band_key in self._lsh_keys(shingles):
+                self._lsh_buckets[band_key].append(idx)
+
+    async def _add_embeddings(self, ids: list[int]):
+        texts = [self._names[idx] for idx in ids]
+        embeddings = np.asarray(await asyncio.to_thread(self.embedding_model._get_text_embeddings, texts),
+                                dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        for idx in ids:
+            self._embedding_rows[idx] = len(self._embedded_ids)
+            self._embedded_ids.append(idx)
+        self._embeddings = embeddings if self._embeddings is None else np.vstack([self._embeddings, embeddings])
+
+    def _candidate_pairs(self, start: int) -> set[tuple[int, int]]:
+        """
+        Block the new names (ids from `start`) against all the known names.
+        """
+        pairs = set()
+        for idx in range(start, len(self._names)):
+            for band_key in self._lsh_keys(self._shingles[idx]):
+                for other in self._lsh_buckets[band_key]:
+                    if other != idx:
+                        pairs.add((min(idx, other), max(idx, other)))
+
+        if self._embeddings is not None and len(self._embedded_ids) > 1:
+            pairs.update(self._embedding_pairs(start))
+        return pairs
+
+    def _embedding_pairs(self, start: int) -> set[tuple[int, int]]:
+        # Top-k of the new names over the embedded names, a block of rows at a time to bound the score matrix
+        pairs = set()
+        embedded_ids = np.asarray(self._embedded_ids)
+        top_k = min(self.config.canonicalization_top_k + 1, len(embedded_ids))
+        new_rows = np.flatnonzero(embedded_ids >= start)
+        for block_start in range(0, len(new_rows), self.config.similarity_block_size):
+            rows = new_rows[block_start: block_start + self.config.similarity_block_size]
+            scores = self._embeddings[rows] @ self._embeddings.T
+            top_rows = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            top_scores = np.take_along_axis(scores, top_rows, axis=1)
+            for row, others, other_scores in zip(rows, top_rows, top_scores):
+                idx = int(embedded_ids[row])
+                for other, score in zip(embedded_ids[others], other_scores):
+                    if other != idx and score >= self.config.canonicalization_embedding_threshold:
+                        pairs.add((min(idx, int(other)), max(idx, int(other))))
+        return pairs
+
+    def _score_pairs(self, pairs: set[tuple[int, int]]) -> list[tuple[float, int, int]]:
+        accepted = []
+        for i, j in pairs:
+            union_size = len(self._shingles[i] | self._shingles[j])
+            jaccard = len(self._shingles[i] & self._shingles[j]) / union_size if union_size > 0 else 0.0
+            if jaccard >= self.config.canonicalization_jaccard_threshold:
+                accepted.append((jaccard, i, j))
+                continue
+            if i in self._embedding_rows and j in self._embedding_rows:
+                cosine = float(self._embeddings[self._embedding_rows[i]] @ self._embeddings[self._embedding_rows[j]])
+                if cosine >= self.config.canonicalization_embedding_threshold:
+                    accepted.append((cosine, i, j))
+        return accepted
+
+    def _find(self, idx: int) -> int:
+        root = idx
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[idx] != root:
+            self._parent[idx], idx = root, self._parent[idx]
+        return root
+
+    def _union(self, i: int, j: int):
+        root_i, root_j = self._find(i), self._find(j)
+        if root_i == root_j or (self._committed[root_i] and self._committed[root_j]):
+            return
+        # Keep the committed name, otherwise the longer (usually the most explicit) name, then the oldest one
+        root, child = sorted([root_i, root_j],
+                             key=lambda r: (not self._committed[r], -len(self._names[r]), r))
+        self._parent[child] = root
+
+    @staticmethod
+    def _shingle(name: str) -> set[str]:
+        normalized = " " + re.sub(r"[^0-9a-z]+", " ", name.lower()).strip() + " "
+        if len(normalized) <= SHINGLE_SIZE:
+            return {normalized}
+        return {normalized[i: i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+    def _lsh_keys(self, shingles: set[str]) -> list[tuple[int, bytes]]:
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) % _MERSENNE_PRIME for shingle in shingles],
+                          dtype=np.int64)
+        signature = ((np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+        rows = MINHASH_NUM_PERM // MINHASH_NUM_BANDS
+        return [(band, signature[band * rows: (band + 1) * rows].tobytes()) for band in range(MINHASH_NUM_BANDS)]
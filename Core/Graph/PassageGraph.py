@@ -1,24 +1,24 @@
 import asyncio
-# from concurrent.futures._base import as_completed
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Any
 
+import igraph as ig
+import numpy as np
+from scipy.sparse import csr_matrix, diags, triu
+from scipy.sparse.csgraph import shortest_path
+
 from Core.Graph.BaseGraph import BaseGraph
 from Core.Schema.ChunkSchema import TextChunk
-from Core.Common.Utils import logger
+from Core.Common.Utils import logger, csr_from_indices
 from tqdm import tqdm
 from Core.Schema.EntityRelation import Entity, Relationship
 from collections import defaultdict
 from itertools import combinations
-import requests
-from Core.Common.Constants import GCUBE_TOKEN, GRAPH_FIELD_SEP
+from Core.Common.Constants import GRAPH_FIELD_SEP
 from Core.Storage.NetworkXStorage import NetworkXStorage
+from Core.Storage.PickleBlobStorage import PickleBlobStorage
 
+from Core.Utils.EntityLinker import get_entity_linker
 from Core.Utils.WAT import WATAnnotation
-import pickle
-import os
-
-import glob
 
 class PassageGraph(BaseGraph):
     """
@@ -37,89 +37,56 @@ class PassageGraph(BaseGraph):
         self.k: int = 30
         self.k_nei: int = 3
         self._graph = NetworkXStorage()
+        self._entity_linker = None  # Entity linking backend, created lazily
+        self.doc_chunk = None  # Chunk storage, used to hydrate the content of the passage nodes
+        self._title_bipartite = PickleBlobStorage()  # Sparse passage-title mentions, in the bipartite mode
+        self._bipartite = None  # Passage-title structure held by the blob storage
+        self._chunk_index = {}  # Row of every passage in the bipartite structure
+        self._reset_adjacency()  # Passage adjacency of the bipartite mode, computed on first use
 
-    @staticmethod
-    async def _wat_entity_linking(text: str):
-        # Main method, text annotation with WAT entity linking system
-        wat_url = 'https://wat.d4science.org/wat/tag/tag'
-        payload = [("gcube-token", GCUBE_TOKEN),
-                   ("text", text),
-                   ("lang", 'en'),
-                   ("tokenizer", "nlp4j"),
-                   ('debug', 9),
-                   ("method",
-                    "spotter:includeUserHint=true:includeNamedEntity=true:includeNounPhrase=true,prior:k=50,filter-valid,centroid:rescore=true,topk:k=5,voting:relatedness=lm,ranker:model=0046.model,confidence:model=pruner-wiki.linear")]
-        # TODO: maybe config it
-        retry_count = 3
-        for attempt in range(retry_count):
-            try:
-                response = requests.get(wat_url, params=payload)
-                return [WATAnnotation(**annotation) for annotation in response.json()['annotations']]
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Retry attempt {attempt + 1} failed: {e}")
-                if attempt == retry_count - 1:
-                    logger.error("All retry attempts failed. Exiting.")
-            return []
+    async def _get_entity_linker(self):
+        if self._entity_linker is None:
+            self._entity_linker = get_entity_linker(self.config, self._graph.namespace)
+        return self._entity_linker
+
+    async def _wat_entity_linking(self, text: str):
+        # Text annotation with the configured entity linking backend (the WAT system by default)
+        entity_linker = await self._get_entity_linker()
+        annotations = await entity_linker.annotate(text)
+        return [WATAnnotation(**annotation) for annotation in annotations or []]
 
     async def _extract_entity_relationship(self, chunk_key_pair: tuple[str, TextChunk]) -> Any:
         chunk_key, chunk_info = chunk_key_pair  # Unpack the chunk key and information
         chunk_info = chunk_info.content
 
         # Entity linking by WAT system
-        logger.info("Linking Entity by WAT system for chunk {chunk_key}".format(chunk_key=chunk_key))
+        logger.debug("Linking Entity by {linker} for chunk {chunk_key}".format(linker=self.config.entity_linker,
+                                                                             chunk_key=chunk_key))
         wat_annotations = await self._wat_entity_linking(chunk_info)
         return await self._build_graph_from_wat(wat_annotations, chunk_key)
 
-    def _run_pool_extract_relationship(self, chunk_per_pair):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(self._extract_entity_relationship(chunk_per_pair))
-        loop.close()
-        return result
-
-
     async def _build_graph(self, chunk_list: List[Any]):
-        save_interval = 10
-      
         try:
+            # The concurrency of the linking requests is bounded by the entity linker itself
+            progress = tqdm(total=len(chunk_list), desc="Linking entities")
+
+            async def _extract(chunk_key_pair):
+                try:
+                    return await self._extract_entity_relationship(chunk_key_pair)
+                except Exception as e:
+                    logger.exception(f"Error linking entities of chunk {chunk_key_pair[0]}: {e}")
+                    return {}
+                finally:
+                    progress.update(1)
+
+            try:
+                results = await asyncio.gather(*[_extract(chunk_key_pair) for chunk_key_pair in chunk_list])
+            finally:
+                progress.close()
+                if self._entity_linker is not None:
+                    await self._entity_linker.close()
+                    self._entity_linker = None
 
-            n = 32
-            results = []
-            cold_start = 169
-            save_files = sorted(glob.glob("alce_save_*.pkl"), key=os.path.getmtime, reverse=True)
-            for save_file in save_files:
-                results.extend(self._load_results(save_file))
-                logger.info(f"Loaded results from {save_file}")
-
-            with ThreadPoolExecutor(max_workers=n) as pool:
-                total_num = len(chunk_list)
-                num = total_num // n
-
-                for i in tqdm(range(num+1)):
-                    save_path = f"alce_save_{i}.pkl"
-                    if i <= cold_start: continue
-
-                    tasks = []
-                    for j in range(n):
-                        if i*n+j < total_num:
-                            task = pool.submit(self._run_pool_extract_relationship, chunk_list[i*n+j])
-                            tasks.append(task)
-                    import pdb
-                    # pdb.set_trace()
-                    for task_1 in as_completed(tasks):
-                        result = task_1.result()
-                        results.append(result)
-                    # 每 save_interval 轮保存一次结果
-                    if (i + 1) % save_interval == 0:
-                        self._save_results(results, save_path)
-                        print(f"Saved results at round {i + 1}")
-
-            # # 保存剩余的结果
-            # if results:
-            #     self._save_results(results, save_path)
-            #     print("Final results saved.")
-            # results = await asyncio.gather(
-            #     *[self._extract_entity_relationship(chunk) for chunk in chunk_list])
             # Build graph based on the relationship of chunks
             await self.__passage_graph__(results, chunk_list)
         except Exception as e:
@@ -127,63 +94,330 @@ class PassageGraph(BaseGraph):
         finally:
             logger.info("Constructing graph finished")
 
-    def _run_pool_merge_relationship(self, edge_item):
-        k, v = edge_item
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(self._merge_edges_then_upsert(k[0],k[1], v))
-        loop.close()
-    
-
     async def __passage_graph__(self, elements, chunk_list: List[Any]):
         # Initialize dictionaries to hold aggregated edge information
         merge_wikis = defaultdict(list)
         maybe_nodes, maybe_edges = defaultdict(list), defaultdict(list)
         # Iterate through each wiki-title
-        edge_exist = set()
         for kw_chunk in elements:
             # Aggregate  information
             for k, v in kw_chunk.items():
                 merge_wikis[k].extend(v)
 
+        merge_wikis = {wiki_key: sorted(set(chunks)) for wiki_key, chunks in merge_wikis.items()}
+        if self.config.max_title_frequency > 0:
+            # Hub titles connect (almost) every passage, they carry no signal but a quadratic number of edges
+            hub_titles = [wiki_key for wiki_key, chunks in merge_wikis.items() if
+                          len(chunks) > self.config.max_title_frequency]
+            for wiki_key in hub_titles:
+                merge_wikis.pop(wiki_key)
+            logger.info(f"Dropped {len(hub_titles)} titles mentioned by more than "
+                        f"{self.config.max_title_frequency} passages")
+
         for chunk_pair in chunk_list:
-          
-            node_data = Entity(entity_name=chunk_pair[0], description=chunk_pair[1].content, source_id=chunk_pair[0])
+            # A passage node only references its chunk, the content is hydrated from the chunk storage on demand
+            node_data = Entity(entity_name=chunk_pair[0], source_id=chunk_pair[0])
             maybe_nodes[chunk_pair[0]].append(node_data)
-        # Merge edge information
-
-        for wiki_key, chunks in tqdm(merge_wikis.items(), total=len(merge_wikis)):
-            chunks = set(chunks)
-            # Use itertools.combinations to generate all possible pairs of chunk-keys
-            for chunk1, chunk2 in combinations(chunks, 2):
-                src_id, tgt_id = tuple(sorted((chunk1, chunk2)))
-                if (src_id, tgt_id) in edge_exist: continue
-                edge_exist.add((src_id, tgt_id))
-                edge_data = Relationship(src_id=src_id, tgt_id=tgt_id, relation_name=wiki_key,
-                                         source_id=GRAPH_FIELD_SEP.join([chunk1, chunk2]))
-                maybe_edges[(src_id, tgt_id)].append(edge_data)
-
-        # Asynchronously merge and upsert nodes
-        await asyncio.gather(*[self._merge_nodes_then_upsert(k, v) for k, v in maybe_nodes.items()])
-        # Asynchronously merge and upsert edges
-        # await asyncio.gather(*[self._merge_edges_then_upsert(k[0], k[1], v) for k, v in maybe_edges.items()])
-        n = 64
-        results = []
-        edge_list = [e for e in maybe_edges.items()]
-        with ThreadPoolExecutor(max_workers=n) as pool:
-                total_num = len(maybe_edges)
-                num = total_num // n
-
-                for i in tqdm(range(num+1)):
-                    tasks = []
-                    for j in range(n):
-                        if i*n+j < total_num:
-                            task = pool.submit(self._run_pool_merge_relationship, edge_list[i*n+j])
-                            tasks.append(task)
-                    for task_1 in as_completed(tasks):
-                        result = task_1.result()
-                        results.append(result)
 
+        if self.config.passage_graph_bipartite:
+            # Only keep the passage-title mentions, the passage adjacency is computed on demand
+            await self._build_title_bipartite(merge_wikis, [chunk_pair[0] for chunk_pair in chunk_list])
+        else:
+            # Merge edge information
+            for wiki_key, chunks in tqdm(merge_wikis.items(), total=len(merge_wikis)):
+                # Use itertools.combinations to generate all possible pairs of chunk-keys
+                for chunk1, chunk2 in combinations(chunks, 2):
+                    src_id, tgt_id = tuple(sorted((chunk1, chunk2)))
+                    if (src_id, tgt_id) in maybe_edges: continue
+                    edge_data = Relationship(src_id=src_id, tgt_id=tgt_id, relation_name=wiki_key,
+                                             source_id=GRAPH_FIELD_SEP.join([chunk1, chunk2]))
+                    maybe_edges[(src_id, tgt_id)].append(edge_data)
+
+        # Merge the nodes and edges, then bulk upsert them
+        await self._merge_then_upsert(maybe_nodes, maybe_edges)
+
+    async def _build_title_bipartite(self, merge_wikis: dict, chunk_ids: list[str]):
+        titles = sorted(merge_wikis.keys())
+        chunk_index = {chunk_id: idx for idx, chunk_id in enumerate(chunk_ids)}
+        mentions = [[chunk_index[chunk_id], title_idx] for title_idx, title in enumerate(titles) for chunk_id in
+                    merge_wikis[title] if chunk_id in chunk_index]
+        title_matrix = csr_from_indices(mentions, shape=(len(chunk_ids), len(titles)))
+        self._bipartite = {"chunk_ids": chunk_ids, "titles": titles, "matrix": title_matrix}
+        await self._title_bipartite.set(self._bipartite)
+        self._chunk_index = chunk_index
+        self._reset_adjacency()
+        logger.info(f"Built the passage-title bipartite structure with {len(chunk_ids)} passages, "
+                    f"{len(titles)} titles and {len(mentions)} mentions")
+
+    def _passage_adjacency(self):
+        """
+        The passage adjacency of the bipartite mode, A = M @ M^T without its diagonal, where M holds the title
+        mentions of the passages in the order of the graph nodes: A[i, j] is the number of titles shared by the
+        passages i and j. It stands for the passage edges, which are the nonzeros of its upper triangle, and is
+        computed on first use.
+        """
+        if self._adjacency is None:
+            nodes = list(self._graph.graph.nodes())
+            title_matrix = self._bipartite["matrix"] if self._bipartite is not None else csr_matrix((0, 0))
+            # Passages missing from the bipartite structure mention no title
+            selection = csr_from_indices([[node_idx, self._chunk_index[node]] for node_idx, node in enumerate(nodes)
+                                          if node in self._chunk_index], shape=(len(nodes), title_matrix.shape[0]))
+            mentions = (selection @ title_matrix).tocsr()
+            adjacency = (mentions @ mentions.T).tocsr()
+            adjacency = (adjacency - diags(adjacency.diagonal())).tocsr()
+            adjacency.eliminate_zeros()
+            edges = triu(adjacency, k=1).tocsr().tocoo()
+            self._passage_nodes = nodes
+            self._passage_node_index = {node: node_idx for node_idx, node in enumerate(nodes)}
+            self._passage_mentions = mentions
+            self._passage_edge_ends = np.stack([edges.row, edges.col], axis=1)
+            self._adjacency = adjacency
+        return self._adjacency
+
+    def _reset_adjacency(self):
+        self._adjacency = None
+        self._passage_nodes, self._passage_node_index = [], {}
+        self._passage_mentions, self._passage_edge_ends = None, None
+
+    def _passage_edge(self, src_idx: int, tgt_idx: int):
+        # Same fields as a stored passage edge, the relation name is the first title shared by both passages
+        src_id, tgt_id = sorted((self._passage_nodes[src_idx], self._passage_nodes[tgt_idx]))
+        shared_titles = np.intersect1d(self._passage_mentions[src_idx].indices,
+                                       self._passage_mentions[tgt_idx].indices)
+        return {"src_id": src_id, "tgt_id": tgt_id, "source_id": GRAPH_FIELD_SEP.join([src_id, tgt_id]),
+                "relation_name": self._bipartite["titles"][shared_titles[0]] if len(shared_titles) else "",
+                "weight": float(self._adjacency[src_idx, tgt_idx]), "description": "", "keywords": "", "rank": 0}
+
+    def _passage_neighbors(self, node_idx: int):
+        adjacency = self._passage_adjacency()
+        return adjacency.indices[adjacency.indptr[node_idx]:adjacency.indptr[node_idx + 1]]
+
+    async def get_neighbors(self, node_id: str):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_neighbors(node_id)
+        self._passage_adjacency()
+        if node_id not in self._passage_node_index:
+            return []
+        return [self._passage_nodes[idx] for idx in self._passage_neighbors(self._passage_node_index[node_id])]
+
+    @property
+    def edge_num(self):
+        if not self.config.passage_graph_bipartite:
+            return super().edge_num
+        self._passage_adjacency()
+        return len(self._passage_edge_ends)
+
+    async def edges(self):
+        if not self.config.passage_graph_bipartite:
+            return await super().edges()
+        self._passage_adjacency()
+        return [(self._passage_nodes[src_idx], self._passage_nodes[tgt_idx])
+                for src_idx, tgt_idx in self._passage_edge_ends]
+
+    async def edges_data(self, need_content=True):
+        if not self.config.passage_graph_bipartite:
+            return await super().edges_data(need_content)
+        self._passage_adjacency()
+        edges = []
+        for src_idx, tgt_idx in self._passage_edge_ends:
+            edge_data = self._passage_edge(src_idx, tgt_idx)
+            if need_content:
+                edge_data["content"] = edge_data["relation_name"]
+            edges.append(edge_data)
+        return edges
+
+    async def get_edge(self, src, tgt):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_edge(src, tgt)
+        self._passage_adjacency()
+        if src not in self._passage_node_index or tgt not in self._passage_node_index:
+            return None
+        src_idx, tgt_idx = self._passage_node_index[src], self._passage_node_index[tgt]
+        if self._adjacency[src_idx, tgt_idx] == 0:
+            return None
+        return self._passage_edge(src_idx, tgt_idx)
+
+    async def get_edge_by_index(self, index):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_edge_by_index(index)
+        self._passage_adjacency()
+        return self._passage_edge(*self._passage_edge_ends[index])
+
+    async def get_edge_weight(self, src_id: str, tgt_id: str):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_edge_weight(src_id, tgt_id)
+        edge_data = await self.get_edge(src_id, tgt_id)
+        return edge_data["weight"] if edge_data is not None else None
+
+    async def get_edge_relation_name_batch(self, edges: list[tuple[str, str]]):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_edge_relation_name_batch(edges)
+        edges_data = [await self.get_edge(src, tgt) for src, tgt in edges]
+        return [edge_data["relation_name"] if edge_data is not None else None for edge_data in edges_data]
+
+    async def get_node_edges(self, source_node_id: str):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_node_edges(source_node_id)
+        neighbors = await self.get_neighbors(source_node_id)
+        if source_node_id not in self._passage_node_index:
+            return None
+        return [(source_node_id, neighbor) for neighbor in neighbors]
+
+    async def node_degree(self, node_id):
+        if not self.config.passage_graph_bipartite:
+            return await super().node_degree(node_id)
+        return len(await self.get_neighbors(node_id))
+
+    async def edge_degree(self, src_id: str, tgt_id: str):
+        if not self.config.passage_graph_bipartite:
+            return await super().edge_degree(src_id, tgt_id)
+        return await self.node_degree(src_id) + await self.node_degree(tgt_id)
+
+    async def get_entities_to_relationships_map(self, is_directed=False):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_entities_to_relationships_map(is_directed)
+        self._passage_adjacency()
+        # Every edge is mapped to its first endpoint, and to the second one as well if the graph is undirected
+        edge_ids = np.arange(len(self._passage_edge_ends))
+        rows, cols = self._passage_edge_ends[:, 0], edge_ids
+        if not is_directed:
+            rows, cols = np.concatenate([rows, self._passage_edge_ends[:, 1]]), np.concatenate([cols, edge_ids])
+        return csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(self._passage_nodes), len(edge_ids)))
+
+    async def personalized_pagerank(self, reset_prob_chunk, damping: float = 0.1):
+        if not self.config.passage_graph_bipartite:
+            return await super().personalized_pagerank(reset_prob_chunk, damping)
+        self._passage_adjacency()
+        # Same PageRank as the stored edges, on the graph of A weighted by the number of shared titles
+        igraph_ = ig.Graph(n=len(self._passage_nodes), edges=self._passage_edge_ends.tolist(), directed=False)
+        igraph_.es['weight'] = self._adjacency[self._passage_edge_ends[:, 0], self._passage_edge_ends[:, 1]].A1
+        pageranked_probs = igraph_.personalized_pagerank(vertices=range(len(self._passage_nodes)), damping=damping,
+                                                         directed=False, weights='weight', reset=reset_prob_chunk[0],
+                                                         implementation='prpack')
+        return np.array(pageranked_probs)
+
+    async def find_k_hop_neighbors_batch(self, start_nodes: list[str], k: int):
+        if not self.config.passage_graph_bipartite:
+            return await super().find_k_hop_neighbors_batch(start_nodes, k)
+        if k < 1:
+            raise ValueError("K-hop neighbours value must greater than 1.")
+        adjacency = self._passage_adjacency()
+        start_idx = [self._passage_node_index[node] for node in start_nodes if node in self._passage_node_index]
+        # One row per start node, expanded hop by hop like the k-hop search of the graph storage
+        current_level = csr_from_indices([[row, idx] for row, idx in enumerate(start_idx)],
+                                         shape=(len(start_idx), adjacency.shape[0])).astype(bool)
+        visited = csr_matrix(current_level.shape, dtype=bool)
+        for _ in range(k):
+            current_level = ((current_level @ adjacency) > 0) > visited
+            visited = visited + current_level
+        return {self._passage_nodes[idx] for idx in np.unique(current_level.indices)}
+
+    async def get_neighbors_from_sources(self, start_nodes: list[str]):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_neighbors_from_sources(start_nodes)
+        # Same expansion as the graph storage: the edges of the start nodes, completed by the edges found by walking
+        # from them (through the other start nodes first) when they have few edges
+        neighbor_list, neighbor_list_cand = [], []
+        for u in start_nodes:
+            neis = await self.get_neighbors(u)
+            neighbor_list.extend([await self.get_edge(u, v) for v in neis])
+            while neis:
+                inter = list(set(neis) & set(start_nodes))
+                new_neis = []
+                for v in inter or neis:
+                    v_neis = await self.get_neighbors(v)
+                    new_neis.extend(v_neis)
+                    neighbor_list_cand.extend([await self.get_edge(v, w) for w in v_neis])
+                if len(neighbor_list_cand) > 10:
+                    break
+                neis = new_neis
+        if len(neighbor_list) <= 5:
+            neighbor_list.extend(neighbor_list_cand)
+        return neighbor_list
+
+    async def get_paths_from_sources(self, start_nodes: list[str], cutoff: int = 5):
+        if not self.config.passage_graph_bipartite:
+            return await super().get_paths_from_sources(start_nodes, cutoff)
+        adjacency = self._passage_adjacency()
+        cand = {self._passage_node_index[node] for node in start_nodes if node in self._passage_node_index}
+        paths = []
+        while cand:
+            start = min(cand)
+            cand.remove(start)
+            # Unweighted shortest paths from the start, every nearest remaining start node extends its path
+            dist, pred = shortest_path(adjacency, unweighted=True, indices=start, return_predecessors=True)
+            path_concat = []
+            while True:
+                reachable = [idx for idx in cand if dist[idx] <= cutoff]
+                if not reachable:
+                    break
+                end = min(reachable, key=lambda idx: (dist[idx], idx))
+                path, cur = [], end
+                while cur != start:
+                    path.append(self._passage_edge(pred[cur], cur))
+                    cur = pred[cur]
+                path_concat.extend(path[::-1])
+                cand.remove(end)
+            if path_concat:
+                paths.append(path_concat)
+        return paths
+
+    async def _clear(self):
+        await super()._clear()
+        self._bipartite, self._chunk_index = None, {}
+        self._reset_adjacency()
+
+    async def _hydrate_passage(self, node_data):
+        """
+        Fill the description of a passage node with the content of its chunk, or an empty description if the chunk
+        is missing. Nodes of the graphs built before the chunk references already hold their content and are
+        returned as is.
+        """
+        if node_data is None or node_data.get("description") or self.doc_chunk is None:
+            return node_data
+        content = await self.doc_chunk.get_data_by_key(node_data["entity_name"])
+        return {**node_data, "description": content or ""}
+
+    async def get_node(self, node_id):
+        return await self._hydrate_passage(await super().get_node(node_id))
+
+    async def get_node_by_index(self, index):
+        return await self._hydrate_passage(await super().get_node_by_index(index))
+
+    async def nodes_data(self):
+        nodes_data = []
+        for node_data in await super().nodes_data():
+            if node_data.get("description") or self.doc_chunk is None:
+                nodes_data.append(node_data)
+                continue
+            node_data = await self._hydrate_passage(node_data)
+            # Same content as a node holding its passage, so the entity index is unchanged
+            node_data["content"] = f"{node_data['entity_name']}: {node_data['description']}"
+            nodes_data.append(node_data)
+        return nodes_data
+
+    async def _load_graph(self, force: bool = False):
+        is_exist = await super()._load_graph(force)
+        if not self.config.passage_graph_bipartite:
+            return is_exist
+        self._title_bipartite.namespace = self._bipartite_namespace()
+        if not await self._title_bipartite.load(force) or await self._title_bipartite.get() is None:
+            return False
+        self._bipartite = await self._title_bipartite.get()
+        self._chunk_index = {chunk_id: idx for idx, chunk_id in enumerate(self._bipartite["chunk_ids"])}
+        self._reset_adjacency()
+        return is_exist
+
+    async def _persist_graph(self, force=False):
+        await super()._persist_graph(force)
+        if self.config.passage_graph_bipartite:
+            self._title_bipartite.namespace = self._bipartite_namespace()
+            await self._title_bipartite.persist()
+
+    def _bipartite_namespace(self):
+        if self._graph.namespace is None:
+            return None
+        return self._graph.namespace.workspace.make_for("passage_title_bipartite")
 
     async def _build_graph_from_wat(self, wat_annotations, chunk_key):
         kw2chunk = defaultdict(set)
@@ -195,16 +429,3 @@ class PassageGraph(BaseGraph):
     @property
     def entity_metakey(self):
         return "entity_name"
-    
-  
-
-    def _save_results(self, results, save_path):
-        """将结果保存到文件"""
-        # 如果文件已存在，则加载旧结果并合并
-        # 保存结果
-        with open(save_path, "wb") as f:
-            pickle.dump(results, f)
-    def _load_results(self, save_path):
-        """从文件加载结果"""
-        with open(save_path, "rb") as f:
-            return pickle.load(f)
\ No newline at end of file
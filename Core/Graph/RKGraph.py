@@ -1,7 +1,7 @@
 import re
 import asyncio
 from collections import defaultdict
-from typing import Union, List, Any
+from typing import Union, List, Any, Optional
 from Core.Graph.BaseGraph import BaseGraph
 from Core.Common.Logger import logger
 from Core.Common.Utils import (
@@ -17,9 +17,9 @@ from Core.Common.Constants import (
     DEFAULT_RECORD_DELIMITER,
     DEFAULT_COMPLETION_DELIMITER,
     DEFAULT_TUPLE_DELIMITER,
-    DEFAULT_ENTITY_TYPES
+    DEFAULT_ENTITY_TYPES,
+    DEFAULT_CHUNK_DELIMITER
 )
-from Core.Common.Memory import Memory
 from Core.Storage.NetworkXStorage import NetworkXStorage
 
 
@@ -28,6 +28,8 @@ class RKGraph(BaseGraph):
     def __init__(self, config, llm, encoder):
         super().__init__(config, llm, encoder)
         self._graph = NetworkXStorage()
+        self._gleaning_yield = defaultdict(int)  # Number of new records added by every gleaning turn
+        self._gleaning_turns = defaultdict(int)  # Number of extractions that ran every gleaning turn
 
     @classmethod
     async def _handle_single_entity_extraction(self, record_attributes: list[str], chunk_key: str) -> Union[
@@ -54,15 +56,51 @@ class RKGraph(BaseGraph):
         records = await self._extract_records_from_chunk(chunk_info)
         return await self._build_graph_from_records(records, chunk_key)
 
+    async def _extract_entity_relationship_batch(self, chunk_key_pairs: list[tuple[str, TextChunk]]):
+        if len(chunk_key_pairs) == 1:
+            return [await self._extract_entity_relationship(chunk_key_pairs[0])]
+        # Extract all the chunks of the pack with one prompt, then split the records back to their chunks
+        packed_input = GraphPrompt.ENTITY_EXTRACTION_PACKED_INPUT.format(
+            num_chunks=len(chunk_key_pairs),
+            chunk_delimiter=DEFAULT_CHUNK_DELIMITER.format(chunk_id="<chunk_id>"),
+            tuple_delimiter=DEFAULT_TUPLE_DELIMITER,
+            record_delimiter=DEFAULT_RECORD_DELIMITER,
+            chunks=self._format_packed_chunks([chunk_info.content for _, chunk_info in chunk_key_pairs])
+        )
+        records_per_chunk = await self._extract_records_from_content(packed_input, len(chunk_key_pairs))
+        return [await self._build_graph_from_records(chunk_records, chunk_key)
+                for chunk_records, (chunk_key, _) in zip(records_per_chunk, chunk_key_pairs)]
+
+    @staticmethod
+    def _split_records_by_chunk(records: list[str], num_chunks: int, first_chunk: Optional[int] = 0) -> list[
+        list[str]]:
+        """
+        Assign every record to the chunk announced by the latest ("chunk"<|>chunk_id) record.
+        Records before the first chunk marker belong to `first_chunk`, or are dropped if it is None.
+        """
+        records_per_chunk = [[] for _ in range(num_chunks)]
+        chunk_idx = first_chunk
+        for record in records:
+            match = re.search(r"\((.*)\)", record)
+            if match is not None:
+                record_attributes = split_string_by_multi_markers(match.group(1), [DEFAULT_TUPLE_DELIMITER])
+                if len(record_attributes) >= 2 and record_attributes[0] == '"chunk"':
+                    marker = record_attributes[1].strip().strip('"')
+                    if marker.isdigit() and int(marker) < num_chunks:
+                        chunk_idx = int(marker)
+                    continue
+            if chunk_idx is not None:
+                records_per_chunk[chunk_idx].append(record)
+        return records_per_chunk
+
     async def _build_graph(self, chunk_list: List[Any]):
         try:
-            elements = await asyncio.gather(
-                *[self._extract_entity_relationship(chunk) for chunk in chunk_list])
-            # Build graph based on the extracted entities and triples
-            await self.__graph__(elements)
+            # Extract the chunks and merge them into the graph incrementally
+            await self._extract_and_merge(chunk_list)
         except Exception as e:
             logger.exception(f"Error building graph: {e}")
         finally:
+            self._log_gleaning_yield()
             logger.info("Constructing graph finished")
 
     async def _extract_records_from_chunk(self, chunk_info: TextChunk):
@@ -72,35 +110,99 @@ class RKGraph(BaseGraph):
         1. https://github.com/gusye1234/nano-graphrag
         2. https://github.com/HKUDS/LightRAG/tree/main
         """
-        context = self._build_context_for_entity_extraction(chunk_info.content)
-        prompt_template = GraphPrompt.ENTITY_EXTRACTION_KEYWORD if self.config.enable_edge_keywords else GraphPrompt.ENTITY_EXTRACTION
-        prompt = prompt_template.format(**context)
+        return (await self._extract_records_from_content(chunk_info.content))[0]
 
-        working_memory = Memory()
+    async def _extract_records_from_content(self, content: str, num_chunks: int = 1) -> list[list[str]]:
+        """
+        Extract the records with the gleaning loop, and return them per chunk of the (packed) content.
 
-        working_memory.add(Message(content=prompt, role="user"))
-        final_result = await self.llm.aask(prompt)
-        working_memory.add(Message(content=final_result, role="assistant"))
+        The conversation is kept as a message history, so every gleaning turn only appends messages to a stable
+        prefix. The loop stops as soon as a gleaning turn yields no new entity or relationship record. For packed
+        content, every response is split by its own chunk markers, which the gleaning prompt asks for again.
+        """
+        context = self._build_context_for_entity_extraction(content)
+        prompt_template = GraphPrompt.ENTITY_EXTRACTION_KEYWORD if self.config.enable_edge_keywords else GraphPrompt.ENTITY_EXTRACTION
+        prompt = prompt_template.format(**context)
 
+        messages = [Message(content=prompt, role="user").to_dict()]
+        final_result = await self.llm.aask(messages)
+        messages.append(Message(content=final_result, role="assistant").to_dict())
+
+        records_per_chunk = self._split_records_by_chunk(self._split_records(final_result), num_chunks)
+        seen_records = {(chunk_idx, record_key) for chunk_idx, records in enumerate(records_per_chunk)
+                        for record_key in map(self._record_key, records) if record_key is not None}
+        continue_prompt = GraphPrompt.ENTITY_CONTINUE_EXTRACTION
+        if num_chunks > 1:
+            continue_prompt += GraphPrompt.ENTITY_CONTINUE_EXTRACTION_PACKED.format(
+                tuple_delimiter=DEFAULT_TUPLE_DELIMITER, record_delimiter=DEFAULT_RECORD_DELIMITER)
+        gleaning_yield = []
         for glean_idx in range(self.config.max_gleaning):
-            working_memory.add(Message(content=GraphPrompt.ENTITY_CONTINUE_EXTRACTION, role="user"))
-            context = "\n".join(f"{msg.sent_from}: {msg.content}" for msg in working_memory.get())
-            glean_result = await self.llm.aask(context)
-            working_memory.add(Message(content=glean_result, role="assistant"))
-            final_result += glean_result
-
-            if glean_idx == self.config.max_gleaning - 1:
+            messages.append(Message(content=continue_prompt, role="user").to_dict())
+            glean_result = await self.llm.aask(messages)
+            messages.append(Message(content=glean_result, role="assistant").to_dict())
+
+            # A gleaned record of packed content can only be credited to a chunk after an explicit marker
+            glean_per_chunk = self._split_records_by_chunk(self._split_records(glean_result), num_chunks,
+                                                           first_chunk=0 if num_chunks == 1 else None)
+            num_new = 0
+            for chunk_idx, glean_records in enumerate(glean_per_chunk):
+                for record in glean_records:
+                    record_key = self._record_key(record)
+                    if record_key is None or (chunk_idx, record_key) not in seen_records:
+                        records_per_chunk[chunk_idx].append(record)
+                        if record_key is not None:
+                            seen_records.add((chunk_idx, record_key))
+                            num_new += 1
+            gleaning_yield.append(num_new)
+            self._gleaning_yield[glean_idx] += num_new
+            self._gleaning_turns[glean_idx] += 1
+
+            if num_new == 0 or glean_idx == self.config.max_gleaning - 1:
                 break
 
-            working_memory.add(Message(content=GraphPrompt.ENTITY_IF_LOOP_EXTRACTION, role="user"))
-            context = "\n".join(f"{msg.sent_from}: {msg.content}" for msg in working_memory.get())
-            if_loop_result = await self.llm.aask(context)
+            if_loop_result = await self.llm.aask(
+                messages + [Message(content=GraphPrompt.ENTITY_IF_LOOP_EXTRACTION, role="user").to_dict()])
             if if_loop_result.strip().strip('"').strip("'").lower() != "yes":
                 break
-        working_memory.clear()
-        return split_string_by_multi_markers(final_result, [
-            DEFAULT_RECORD_DELIMITER, DEFAULT_COMPLETION_DELIMITER
-        ])
+        if gleaning_yield:
+            num_records = sum(len(records) for records in records_per_chunk)
+            logger.debug(f"Gleaning yield of the chunk: {gleaning_yield} new records over {num_records} records")
+        return records_per_chunk
+
+    @staticmethod
+    def _split_records(result: str) -> list[str]:
+        return split_string_by_multi_markers(result, [DEFAULT_RECORD_DELIMITER, DEFAULT_COMPLETION_DELIMITER])
+
+    @staticmethod
+    def _record_key(record: str):
+        """
+        Normalized key of an entity or relationship record, used to drop the records repeated by gleaning.
+        Other records (e.g., the chunk markers of packed extraction) have no key and are always kept.
+        """
+        match = re.search(r"\((.*)\)", record)
+        if match is None:
+            return None
+        record_attributes = split_string_by_multi_markers(match.group(1), [DEFAULT_TUPLE_DELIMITER])
+        if record_attributes[0] not in ('"entity"', '"relationship"'):
+            return None
+        return tuple(clean_str(attribute).upper() for attribute in record_attributes[:3])
+
+    def _extraction_stats(self) -> dict:
+        return dict(gleaning_yield=dict(self._gleaning_yield), gleaning_turns=dict(self._gleaning_turns))
+
+    def _merge_extraction_stats(self, stats: dict):
+        for glean_idx, num_new in stats.get("gleaning_yield", {}).items():
+            self._gleaning_yield[glean_idx] += num_new
+        for glean_idx, num_turns in stats.get("gleaning_turns", {}).items():
+            self._gleaning_turns[glean_idx] += num_turns
+
+    def _log_gleaning_yield(self):
+        if not self._gleaning_turns:
+            return
+        report = ", ".join(f"turn {glean_idx + 1}: {self._gleaning_yield[glean_idx]} new records over "
+                           f"{self._gleaning_turns[glean_idx]} extractions"
+                           for glean_idx in sorted(self._gleaning_turns))
+        logger.info(f"Gleaning yield: {report}")
 
     async def _build_graph_from_records(self, records: list[str], chunk_key: str):
         maybe_nodes, maybe_edges = defaultdict(list), defaultdict(list)
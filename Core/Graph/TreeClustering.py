@@ -0,0 +1,133 @@
+"""
+Clustering engine of the RAPTOR trees: a UMAP reduction followed by a Gaussian mixture whose number of components
+is selected by BIC.
+
+- The BIC candidates are fitted in parallel across processes, and the fitted mixture of the selected count is
+  reused instead of being fitted again.
+- The UMAP reductions are cached by the hash of the embedding set and the reduction parameters.
+- The memberships are sparse CSR matrices of shape (n_samples, n_clusters), a sample may belong to several
+  clusters (soft assignment) or to none of them.
+- Instead of the full sweep, the count can be searched by hill climbing with early stopping, warm-started from a
+  previous selection scaled by the number of samples.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+import umap
+from scipy.sparse import csc_matrix, csr_matrix
+from sklearn.mixture import GaussianMixture
+
+from Core.Common.Logger import logger
+
+
+def _fit_gmm(embeddings: np.ndarray, n_components: int, random_state: int) -> Tuple[float, GaussianMixture]:
+    # Module level, so that it can be sent to the worker processes
+    gm = GaussianMixture(n_components=n_components, random_state=random_state)
+    gm.fit(embeddings)
+    return gm.bic(embeddings), gm
+
+
+class TreeClustering:
+
+    def __init__(self, config):
+        self.config = config
+        self._pool = None
+        self._reductions = OrderedDict()
+
+    async def reduce(self, embeddings: np.ndarray, n_neighbors: int, n_components: int) -> np.ndarray:
+        key = hashlib.blake2b(np.ascontiguousarray(embeddings).tobytes() + repr(
+            (embeddings.shape, n_neighbors, n_components, self.config.cluster_metric)).encode()).hexdigest()
+        if key in self._reductions:
+            self._reductions.move_to_end(key)
+            return self._reductions[key]
+
+        reducer = umap.UMAP(n_neighbors=n_neighbors, n_components=n_components, metric=self.config.cluster_metric)
+        reduced = await asyncio.to_thread(reducer.fit_transform, embeddings)
+        self._reductions[key] = reduced
+        if len(self._reductions) > self.config.umap_cache_size:
+            self._reductions.popitem(last=False)
+        return reduced
+
+    async def gmm_cluster(self, embeddings: np.ndarray, threshold: float, random_state: int = 0,
+                          warm_start: Optional[Tuple[int, int]] = None):
+        """
+        Soft-assign the embeddings to the components of the mixture selected by BIC, return the membership matrix
+        and the number of components. `warm_start` is the (n_samples, n_clusters) of a previous selection, where
+        the early-stopping search starts from.
+        """
+        if len(embeddings) > self.config.threshold_cluster_num:
+            max_clusters = len(embeddings) // 100
+            candidates = np.arange(max_clusters - 1, max_clusters)
+        else:
+            max_clusters = min(50, len(embeddings))
+            candidates = np.arange(1, max_clusters)
+
+        if self.config.cluster_search == "early_stop" and len(candidates) > 1:
+            results = await self._search_candidates(embeddings, candidates, random_state, warm_start)
+        else:
+            results = await self._fit_candidates(embeddings, candidates, random_state)
+        optimal_clusters = min(results, key=lambda n: (results[n][0], n))
+
+        gm = results[optimal_clusters][1]
+        membership = csr_matrix(gm.predict_proba(embeddings) > threshold)
+        return membership, optimal_clusters
+
+    async def _fit_candidates(self, embeddings: np.ndarray, candidates, random_state: int) -> dict:
+        candidates = [int(n) for n in candidates]
+        if self.config.cluster_max_workers <= 1 or len(candidates) == 1:
+            fitted = [_fit_gmm(embeddings, n, random_state) for n in candidates]
+        else:
+            loop = asyncio.get_running_loop()
+            fitted = await asyncio.gather(
+                *[loop.run_in_executor(self._get_pool(), _fit_gmm, embeddings, n, random_state) for n in candidates])
+        return dict(zip(candidates, fitted))
+
+    async def _search_candidates(self, embeddings: np.ndarray, candidates: np.ndarray, random_state: int,
+                                 warm_start: Optional[Tuple[int, int]]) -> dict:
+        """
+        Hill-climb over the candidate counts: starting from the warm start, keep fitting the counts around the best
+        BIC so far until `cluster_search_patience` counts on both of its sides were fitted without improving it.
+        """
+        patience = self.config.cluster_search_patience
+        if warm_start is None:
+            start = 0
+        else:
+            last_samples, last_clusters = warm_start
+            hint = last_clusters * len(embeddings) / last_samples
+            start = int(np.argmin(np.abs(candidates - hint)))
+
+        results = {}
+        lo, hi = max(start - 1, 0), min(start + 1, len(candidates) - 1)
+        pending = list(candidates[lo: hi + 1])
+        while len(pending) > 0:
+            results.update(await self._fit_candidates(embeddings, pending, random_state))
+            best = int(np.searchsorted(candidates, min(results, key=lambda n: (results[n][0], n))))
+            new_lo, new_hi = max(min(lo, best - patience), 0), min(max(hi, best + patience), len(candidates) - 1)
+            pending = list(candidates[new_lo: lo]) + list(candidates[hi + 1: new_hi + 1])
+            lo, hi = new_lo, new_hi
+
+        logger.info(f"Fitted {len(results)} of {len(candidates)} GMM candidates")
+        return results
+
+    @staticmethod
+    def cluster_members(membership: csc_matrix, label: int) -> np.ndarray:
+        """
+        Sorted sample indices of a cluster, the membership matrix is in the CSC format so that this is a slice.
+        """
+        return membership.indices[membership.indptr[label]: membership.indptr[label + 1]]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.config.cluster_max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
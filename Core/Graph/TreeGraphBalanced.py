@@ -1,104 +1,179 @@
-from Core.Graph.BaseGraph import BaseGraph
-from Core.Schema.ChunkSchema import TextChunk
+from Core.Graph.BaseTreeGraph import BaseTreeGraph
 from Core.Common.Logger import logger
-from Core.Index.EmbeddingFactory import get_rag_embedding
-from Core.Prompt.RaptorPrompt import SUMMARIZE
-from Core.Storage.TreeGraphStorage import TreeGraphStorage
 from Core.Schema.TreeSchema import TreeNode
 
-from sklearn.metrics import pairwise_distances_argmin_min
+from typing import List, Any
 
-import asyncio
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
-
-from typing import List, Set, Any
-
-Embedding = List[float]
+CLUSTERING_BLOCK_SIZE = 4096  # Number of points whose distances to the centers are computed at once
 
 import numpy as np
-import umap
-import random
-from sklearn.mixture import GaussianMixture
-
-class TreeGraphBalanced(BaseGraph):
-    max_workers: int = 16
-    leaf_workers: int = 32
-    def __init__(self, config, llm, encoder):
-        super().__init__(config, llm, encoder)
-        self._graph: TreeGraphStorage = TreeGraphStorage()  # Tree index
-        self.embedding_model = get_rag_embedding(config.embedding.api_type, config)  # Embedding model
-        self.config = config.graph # Only keep the graph config
-        random.seed(self.config.random_seed)
-
-    def _create_task_for(self, func):
-        def _pool_func(**params):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(func(**params))
-            loop.close()
-        return _pool_func
-
-    def _create_task_with_return(self, func):
-        def _pool_func(**params):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(func(**params))
-            loop.close()
-            return result
-        return _pool_func
+from scipy.sparse import csr_matrix
+
+class TreeGraphBalanced(BaseTreeGraph):
+
+    @staticmethod
+    def _candidate_distances(block: np.ndarray, centers: np.ndarray, center_norms: np.ndarray, pool: np.ndarray):
+        # Distances of the points to their own candidate centers as sqrt(|x|^2 - 2 x.c + |c|^2), gathered one candidate
+        # column at a time so that no (points, candidates, dim) array is built
+        dots = np.empty(pool.shape)
+        for column in range(pool.shape[1]):
+            dots[:, column] = np.einsum("ij,ij->i", block, centers[pool[:, column]])
+        squared_distances = (block ** 2).sum(axis=1)[:, None] - 2 * dots + center_norms[pool]
+        return np.sqrt(np.maximum(squared_distances, 0))
+
+    def _nearest_centers(self, embeddings: np.ndarray, centers: np.ndarray, n_candidates: int):
+        # The n_candidates nearest centers of every point by ascending distance, computed blockwise
+        # The centers are ranked in single precision, only the distances to the kept candidates are exact
+        ranked_centers = centers.astype(np.float32)
+        ranked_norms = (ranked_centers ** 2).sum(axis=1)
+        center_norms = (centers ** 2).sum(axis=1)
+        candidates = np.empty((len(embeddings), n_candidates), dtype=np.int64)
+        distances = np.empty((len(embeddings), n_candidates))
+        for start in range(0, len(embeddings), CLUSTERING_BLOCK_SIZE):
+            block = embeddings[start: start + CLUSTERING_BLOCK_SIZE]
+            # The norms of the points do not change the ranking
+            block_distances = block.astype(np.float32) @ ranked_centers.T
+            block_distances *= -2
+            block_distances += ranked_norms
+            if n_candidates < len(centers):
+                top = np.argpartition(block_distances, n_candidates - 1, axis=1)[:, :n_candidates]
+            else:
+                top = np.tile(np.arange(len(centers)), (len(block), 1))
+            top_distances = self._candidate_distances(block, centers, center_norms, top)
+            order = np.argsort(top_distances, axis=1, kind="stable")
+            candidates[start: start + len(block)] = np.take_along_axis(top, order, axis=1)
+            distances[start: start + len(block)] = np.take_along_axis(top_distances, order, axis=1)
+        return candidates, distances
+
+    def _neighbor_centers(self, centers: np.ndarray, labels: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """
+        The nearest centers of every center, searched among the candidates of the points assigned to it.
+
+        Centers with fewer neighbors than candidates per point are padded with themselves.
+        """
+        n_clusters, n_neighbors = len(centers), candidates.shape[1]
+        pairs = np.unique(np.repeat(labels, n_neighbors) * n_clusters + candidates.ravel())
+        owners, neighbors = pairs // n_clusters, pairs % n_clusters
+        # Squared distances of the pairs, computed blockwise like the candidate distances
+        center_norms = (centers ** 2).sum(axis=1)
+        pair_distances = center_norms[owners] + center_norms[neighbors]
+        for start in range(0, len(pairs), CLUSTERING_BLOCK_SIZE):
+            block = slice(start, start + CLUSTERING_BLOCK_SIZE)
+            pair_distances[block] -= 2 * np.einsum("ij,ij->i", centers[owners[block]], centers[neighbors[block]])
+        order = np.lexsort((pair_distances, owners))
+        owners, neighbors = owners[order], neighbors[order]
+        group_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        ranks = np.arange(len(owners)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(owners)]))
+        kept = ranks < n_neighbors
+        neighbor_centers = np.tile(np.arange(n_clusters)[:, None], (1, n_neighbors))
+        neighbor_centers[owners[kept], ranks[kept]] = neighbors[kept]
+        return neighbor_centers
+
+    def _refresh_candidates(self, embeddings: np.ndarray, centers: np.ndarray, labels: np.ndarray,
+                            candidates: np.ndarray):
+        """
+        The nearest candidate centers of every point after the centers moved.
+
+        Instead of searching all the centers again, every point only ranks its previous candidates and the neighbors of
+        its two nearest candidates, so a center that came closer is found through the points assigned near it.
+        """
+        n_candidates = candidates.shape[1]
+        neighbor_centers = self._neighbor_centers(centers, labels, candidates)
+        center_norms = (centers ** 2).sum(axis=1)
+        new_candidates = np.empty_like(candidates)
+        distances = np.empty(candidates.shape)
+        for start in range(0, len(embeddings), CLUSTERING_BLOCK_SIZE):
+            rows = slice(start, start + CLUSTERING_BLOCK_SIZE)
+            block_candidates = candidates[rows]
+            pool = np.sort(np.hstack([block_candidates, neighbor_centers[block_candidates[:, :2]].reshape(
+                len(block_candidates), -1)]), axis=1)
+            pool_distances = self._candidate_distances(embeddings[rows], centers, center_norms, pool)
+            # A center in both the candidates and the neighbors is only kept once
+            pool_distances[:, 1:][pool[:, 1:] == pool[:, :-1]] = np.inf
+            order = np.argsort(pool_distances, axis=1, kind="stable")[:, :n_candidates]
+            new_candidates[rows] = np.take_along_axis(pool, order, axis=1)
+            distances[rows] = np.take_along_axis(pool_distances, order, axis=1)
+        return new_candidates, distances
+
+    @staticmethod
+    def _accept_proposals(labels: np.ndarray, remaining: np.ndarray, points: np.ndarray, proposed: np.ndarray,
+                          proposed_distances: np.ndarray):
+        # Every center accepts its closest proposers up to its remaining capacity
+        order = np.lexsort((points, proposed_distances, proposed))
+        points, proposed = points[order], proposed[order]
+        group_starts = np.flatnonzero(np.r_[True, proposed[1:] != proposed[:-1]])
+        ranks = np.arange(len(points)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(points)]))
+        accepted = ranks < remaining[proposed]
+        labels[points[accepted]] = proposed[accepted]
+        remaining -= np.bincount(proposed[accepted], minlength=len(remaining))
+
+    def _balanced_assign(self, embeddings: np.ndarray, centers: np.ndarray, candidates: np.ndarray,
+                         distances: np.ndarray, capacity: int) -> np.ndarray:
+        """
+        Assign every point to a center, no center gets more than `capacity` points.
+
+        In every round, the unassigned points propose to their next nearest candidate center, and each center accepts
+        its closest proposers up to its remaining capacity. The points rejected by all their candidates propose in the
+        same way to the nearest centers that still have room, until all of them are assigned.
+        """
+        n_samples, n_clusters = len(embeddings), len(centers)
+        labels = np.full(n_samples, -1, dtype=np.int64)
+        remaining = np.full(n_clusters, capacity, dtype=np.int64)
+
+        for round_ in range(candidates.shape[1]):
+            points = np.flatnonzero(labels < 0)
+            if len(points) == 0:
+                break
+            self._accept_proposals(labels, remaining, points, candidates[points, round_], distances[points, round_])
+
+        rejected = np.flatnonzero(labels < 0)
+        while len(rejected) > 0:
+            # The nearest open center of every rejected point has room, so each pass assigns some of them
+            open_centers = np.flatnonzero(remaining > 0)
+            open_candidates, open_distances = self._nearest_centers(
+                embeddings[rejected], centers[open_centers], min(candidates.shape[1], len(open_centers)))
+            for round_ in range(open_candidates.shape[1]):
+                pending = np.flatnonzero(labels[rejected] < 0)
+                if len(pending) == 0:
+                    break
+                self._accept_proposals(labels, remaining, rejected[pending],
+                                       open_centers[open_candidates[pending, round_]], open_distances[pending, round_])
+            rejected = rejected[labels[rejected] < 0]
+        return labels
 
     async def _perform_clustering(
         self, embeddings: np.ndarray
-    ) -> List[np.ndarray]:
+    ) -> np.ndarray:
 
         n_samples = embeddings.shape[0]
         logger.info("Perform Clustering: n_samples = {n_samples}".format(n_samples=n_samples))
-        n_clusters = n_samples // self.config.size_of_clusters
-        centers = embeddings[np.random.choice(n_samples, n_clusters, replace=False)]
-        labels = np.zeros(n_samples, dtype=int)
-        cluster_sizes = np.zeros(n_clusters, dtype=int)
-        max_size_diff = self.config.max_size_percentage * n_samples / n_clusters
-
-        def _balance_clusters():
-            for i in range(n_samples):
-                if cluster_sizes[new_labels[i]] > n_samples / n_clusters + max_size_diff:
-                    small_clusters = [j for j in range(n_clusters) if cluster_sizes[j] < n_samples / n_clusters]
-                    distances = np.linalg.norm(embeddings[i] - new_centers[small_clusters], axis=1)
-                    new_cluster = small_clusters[np.argmin(distances)]
-                    cluster_sizes[new_labels[i]] -= 1
-                    new_labels[i] = new_cluster
-                    cluster_sizes[new_labels[i]] += 1
-
-        for i in range(self.config.max_iter):
-            logger.info("Performing balanced K-means: iteration {iter}".format(iter=i))
-            new_labels = pairwise_distances_argmin_min(embeddings, centers)[0]
-            
-            def _process_clusters(n_clusters, new_labels):
-                mapping = {v: i for i, v in enumerate(dict.fromkeys(new_labels))}
-                new_labels = [mapping[x] for x in new_labels]
-                n_clusters = len(mapping)
-                # import pdb
-                # pdb.set_trace()
-                cluster_sizes = np.bincount(new_labels, minlength=n_clusters)  # 更新簇大小
-                new_centers = np.array([embeddings[np.array(new_labels) == i].mean(axis=0) for i in range(n_clusters)])
-                return n_clusters, new_labels, new_centers, cluster_sizes
-            
-            n_clusters, new_labels, new_centers, cluster_sizes = _process_clusters(n_clusters, new_labels)
-            _balance_clusters()
-            n_clusters, new_labels, new_centers, cluster_sizes = _process_clusters(n_clusters, new_labels)
-
-            if n_clusters < n_samples // self.config.size_of_clusters:
-                break
+        n_clusters = max(n_samples // self.config.size_of_clusters, 1)
+        n_candidates = min(self.config.balanced_candidate_centers, n_clusters)
+        rng = np.random.RandomState(self.config.random_seed)
+        centers = embeddings[rng.choice(n_samples, n_clusters, replace=False)]
+        # A cluster may exceed the average size by max_size_percentage of it
+        capacity = int(np.ceil(n_samples / n_clusters * (1 + self.config.max_size_percentage)))
+
+        candidates, distances = self._nearest_centers(embeddings, centers, n_candidates)
+        labels = np.zeros(n_samples, dtype=np.int64)
+        i = 0
+        for i in range(1, self.config.max_iter + 1):
+            labels = self._balanced_assign(embeddings, centers, candidates, distances, capacity)
+            sizes = np.bincount(labels, minlength=n_clusters)
+            sums = csr_matrix((np.ones(n_samples), (labels, np.arange(n_samples))),
+                              shape=(n_clusters, n_samples)) @ embeddings
+            # Empty clusters keep their centers
+            new_centers = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centers)
 
             center_shift = np.linalg.norm(new_centers - centers)
-            if center_shift <= self.config.tol:
-                break
-
             centers = new_centers
-            labels = new_labels
+            if center_shift <= self.config.tol or i == self.config.max_iter:
+                break
+            candidates, distances = self._refresh_candidates(embeddings, centers, labels, candidates)
+        logger.info("Balanced K-means finished after {iter} iterations".format(iter=i))
 
-        return labels
+        # Relabel the non-empty clusters consecutively
+        return np.unique(labels, return_inverse=True)[1]
 
 
     async def _clustering(self, nodes: List[TreeNode]) -> List[List[TreeNode]]:
@@ -113,124 +188,13 @@ class TreeGraphBalanced(BaseGraph):
 
         return node_clusters
 
-    def _embed_text(self, text: str):
-        return self.embedding_model._get_text_embedding(text)
-
-    async def _create_node(self, layer: int, text: str, children_indices: Set[int] = None):
-        embedding = self._embed_text(text)
-        node_id = self._graph.num_nodes  # Give it an index
-        logger.info(
-            "Create node_id = {node_id}, children = {children}".format(node_id=node_id, children=children_indices))
-        return self._graph.upsert_node(node_id=node_id,
-                                       node_data={"layer": layer, "text": text, "children": children_indices,
-                                                  "embedding": embedding})
-
-    async def _extract_entity_relationship(self, chunk_key_pair: tuple[str, TextChunk]) -> TreeNode:
-        # Build a leaf node from a text chunk
-        chunk_key, chunk_info = chunk_key_pair
-        leaf_node = await self._create_node(0, chunk_info.content)
-        return leaf_node
-
-    async def _extract_cluster_relationship(self, layer: int, cluster: List[TreeNode]) -> TreeNode:
-        # Build a non-leaf node from a cluster of nodes
-        summarized_text = await self._summarize_from_cluster(cluster, self.config.summarization_length)
-        parent_node = await self._create_node(layer, summarized_text, {node.index for node in cluster})
-        return parent_node
-
-    async def _create_node_without_embedding(self, layer: int, text: str, children_indices: Set[int] = None):
-        # embedding = self._embed_text(text)
-        logger.info(
-            "Create node_id = unassigned, children = {children}".format(node_id=0, children=children_indices))
-        return self._graph.upsert_node(node_id=0,
-                                       node_data={"layer": layer, "text": text, "children": children_indices,
-                                                  "embedding": []})
-
-    async def _extract_entity_relationship_without_embedding(self, chunk_key_pair: tuple[str, TextChunk]) -> TreeNode:
-        # Build a leaf node from a text chunk
-        chunk_key, chunk_info = chunk_key_pair
-        leaf_node = await self._create_node_without_embedding(0, chunk_info.content)
-        return leaf_node
-
-    async def _extract_cluster_relationship_without_embedding(self, layer: int, cluster: List[TreeNode]) -> TreeNode:
-        # Build a non-leaf node from a cluster of nodes
-        summarized_text = await self._summarize_from_cluster(cluster, self.config.summarization_length)
-        parent_node = await self._create_node_without_embedding(layer, summarized_text, {node.index for node in cluster})
-        return parent_node
-
-    async def _summarize_from_cluster(self, node_list: List[TreeNode], summarization_length=150) -> str:
-        # Give a summarization from a cluster of nodes
-        node_texts = f"\n\n".join([' '.join(node.text.splitlines()) for node in node_list])
-        content = SUMMARIZE.format(context=node_texts)
-        return await self.llm.aask(content, max_tokens=summarization_length)
-
-    async def _batch_embed_and_assign(self, layer):
-        current_layer = self._graph.get_layer(layer)
-        texts = [node.text for node in current_layer]
-               # For openai embedding model 
-        embeddings = []
-        batch_size = self.embedding_model.embed_batch_size
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_embeddings = self.embedding_model._get_text_embeddings(batch)
-            embeddings.extend(batch_embeddings)
-        # embeddings = self.embedding_model._get_text_embeddings(texts)
-        start_id = self._graph.get_node_num() - len(self._graph.get_layer(layer))
-        for i in range(start_id, len(self._graph.nodes)):
-            self._graph.nodes[i].id = i
-            self._graph.nodes[i].embedding = embeddings[i - start_id]
-        for node, embedding in zip(self._graph.get_layer(layer), embeddings):
-            node.embeddings = embedding
-            node.index = start_id
-            start_id += 1
-
-    async def _build_tree_from_leaves(self):
-        for layer in range(self.config.num_layers):  # build a new layer
-            logger.info("length of layer: {length}".format(length=len(self._graph.get_layer(layer))))
-            if len(self._graph.get_layer(layer)) <= self.config.reduction_dimension + 1:
-                break
-
-            self._graph.add_layer()
-
-            clusters = await self._clustering(nodes = self._graph.get_layer(layer))
-
-            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-                for i in range(0, self.max_workers):
-                    cluster_tasks = [pool.submit(self._create_task_for(self._extract_cluster_relationship_without_embedding), layer = layer + 1, cluster = cluster) for (j, cluster) in enumerate(clusters) if j % self.max_workers == i]
-                    as_completed(cluster_tasks)
-
-            logger.info("To batch embed current layer")
-            await self._batch_embed_and_assign(self._graph.num_layers - 1)
-
-
-            logger.info("Layer: {layer}".format(layer=layer))
-
-        logger.info(self._graph.num_layers)
-        
+    async def _cluster_layer(self, nodes: List[TreeNode]) -> List[List[TreeNode]]:
+        return await self._clustering(nodes = nodes)
 
     async def _build_graph(self, chunks: List[Any]):
         is_load = await self._graph.load_tree_graph_from_leaves()
         if is_load:
             logger.info(f"Loaded {len(self._graph.leaf_nodes)} Leaf Embeddings")
         else:
-            self._graph.clear()  # clear the storage before rebuilding
-            self._graph.add_layer()
-            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-                # leaf_tasks = []
-                # for index, chunk in enumerate(chunks):
-                #     logger.info(index)
-                #     leaf_tasks.append(pool.submit(self._create_task_for(self._extract_entity_relationship), chunk_key_pair=chunk))
-                for i in range(0, self.max_workers):
-                    leaf_tasks = [pool.submit(self._create_task_for(self._extract_entity_relationship_without_embedding), chunk_key_pair=chunk) for index, chunk in enumerate(chunks) if index % self.max_workers == i]
-                    as_completed(leaf_tasks)
-                    # time.sleep(2)
-            logger.info(len(chunks))
-            logger.info(f"To batch embed leaves")
-            await self._batch_embed_and_assign(self._graph.num_layers - 1)
-            logger.info(f"Created {len(self._graph.leaf_nodes)} Leaf Embeddings")
-            await self._graph.write_tree_leaves()
+            await self._create_leaves(chunks)
         await self._build_tree_from_leaves()
-        
-    @property
-    def entity_metakey(self):
-        return "index"
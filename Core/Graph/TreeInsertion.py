@@ -0,0 +1,119 @@
+"""
+Incremental insertion of new leaves into an existing RAPTOR tree.
+
+The new leaves are assigned to the nearest layer-1 cluster, whose centroid is the mean of the (normalized) embeddings
+of its children. Only the summaries of the changed clusters are regenerated, and the change is propagated to their
+ancestors. When the new leaves drift too far from the existing clusters, the upper layers are rebuilt from all the
+leaves instead, reusing the embeddings of the existing leaves.
+"""
+from typing import Any, List
+
+import numpy as np
+
+from Core.Common.Logger import logger
+from Core.Schema.TreeSchema import TreeNode, TreeSchema
+from Core.Storage.TreeGraphStorage import TreeGraphStorage
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+class TreeLeafInserter:
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.config = graph.config
+        self._storage: TreeGraphStorage = graph._graph
+
+    async def insert(self, chunks: List[Any]) -> bool:
+        # Returns whether the tree changed
+        self._storage.materialize()
+        leaf_texts = {node.text for node in self._storage.leaf_nodes or []}
+        new_texts = list(dict.fromkeys(chunk_info.content for _, chunk_info in chunks
+                                       if chunk_info.content not in leaf_texts))
+        if len(new_texts) == 0:
+            logger.info("No new leaves to insert into the tree")
+            return False
+        new_embeddings = np.asarray(await self.graph._embed_texts(new_texts), dtype=np.float32)
+
+        if self._storage.num_layers < 2:
+            drift = np.inf
+        else:
+            labels, drift = self._assign(new_embeddings)
+        if drift > self.config.tree_drift_threshold:
+            logger.info(f"Drift {drift:.3f} of {len(new_texts)} new leaves exceeds the threshold, rebuilding the tree")
+            await self._rebuild(new_texts, new_embeddings)
+            return True
+
+        logger.info(f"Inserting {len(new_texts)} new leaves into the tree, drift = {drift:.3f}")
+        parents = self._storage.get_layer(1)
+        changed = set()
+        for text, embedding, label in zip(new_texts, new_embeddings, labels):
+            index = self._storage.num_nodes
+            self._storage.upsert_node(node_id=index,
+                                      node_data={"layer": 0, "text": text, "children": set(), "embedding": embedding})
+            parents[label].children.add(index)
+            changed.add(parents[label].index)
+        await self._propagate(changed)
+        await self._storage.write_tree_leaves(self._leaf_tree())
+        return True
+
+    def _assign(self, new_embeddings: np.ndarray):
+        """
+        Assign the new leaves to the nearest layer-1 centroids, the drift is the mean cosine distance of the new
+        leaves to their centroids relative to the one of the existing leaves.
+        """
+        parents = self._storage.get_layer(1)
+        centroids, member_distances = [], []
+        for parent in parents:
+            children = np.fromiter(sorted(parent.children), dtype=np.int64)
+            members = _normalize(self._storage.get_embeddings(children))
+            centroid = _normalize(members.mean(axis=0, keepdims=True))[0]
+            centroids.append(centroid)
+            member_distances.append(1 - members @ centroid)
+        centroids = np.asarray(centroids)
+        baseline = float(np.concatenate(member_distances).mean())
+
+        similarities = _normalize(new_embeddings) @ centroids.T
+        labels = similarities.argmax(axis=1)
+        drift = float((1 - similarities.max(axis=1)).mean()) / max(baseline, 1e-12)
+        return labels, drift
+
+    async def _propagate(self, changed: set):
+        # Regenerate the summaries of the changed nodes layer by layer, their parents change in turn
+        for layer in range(1, self._storage.num_layers):
+            nodes = [node for node in self._storage.get_layer(layer) if node.index in changed]
+            if len(nodes) == 0:
+                break
+            clusters = [[self._storage.nodes[child] for child in sorted(node.children)] for node in nodes]
+            summaries = await self.graph._summarize_clusters(clusters)
+            embeddings = await self.graph._embed_texts(summaries)
+            for node, summary, embedding in zip(nodes, summaries, embeddings):
+                node.text = summary
+                node.embedding = embedding
+            logger.info(f"Regenerated {len(nodes)} summaries of layer {layer}")
+
+            changed = {node.index for node in nodes}
+            if layer + 1 < self._storage.num_layers:
+                changed = {parent.index for parent in self._storage.get_layer(layer + 1)
+                           if not changed.isdisjoint(parent.children)}
+
+    async def _rebuild(self, new_texts: List[str], new_embeddings: np.ndarray):
+        leaf_tree = self._leaf_tree()
+        self._storage.clear()
+        self._storage.add_layer()
+        for node in leaf_tree.all_nodes:
+            self._storage.upsert_node(node_id=node.index, node_data={"layer": 0, "text": node.text, "children": set(),
+                                                                     "embedding": node.embedding})
+        for text, embedding in zip(new_texts, new_embeddings):
+            self._storage.upsert_node(node_id=self._storage.num_nodes,
+                                      node_data={"layer": 0, "text": text, "children": set(), "embedding": embedding})
+        await self._storage.write_tree_leaves()
+        await self.graph._build_tree_from_leaves()
+
+    def _leaf_tree(self):
+        # The leaves checkpoint expects the leaves to be indexed from 0
+        leaves = [TreeNode(text=node.text, index=index, children=set(), embedding=node.embedding)
+                  for index, node in enumerate(self._storage.leaf_nodes)]
+        return TreeSchema(all_nodes=leaves, layer_to_nodes=[leaves])
@@ -8,7 +8,7 @@ from Core.Common.ContextMixin import ContextMixin
 from Core.Schema.RetrieverContext import RetrieverContext
 from Core.Common.TimeStatistic import TimeStatistic
 from Core.Graph import get_graph
-from Core.Index import get_index, get_index_config
+from Core.Index import get_index, get_index_config, get_rag_embedding
 from Core.Query import get_query
 from Core.Storage.NameSpace import Workspace
 from Core.Community.ClusterFactory import get_community
@@ -69,7 +69,11 @@ class GraphRAG(ContextMixin, BaseModel):
         cls.ENCODER = tiktoken.encoding_for_model(data.config.token_model)
         cls.workspace = Workspace(data.config.working_dir, data.config.index_name)  # register workspace
         cls.graph = get_graph(data.config, llm=data.llm, encoder=cls.ENCODER)  # register graph
+        if data.config.graph.enable_entity_canonicalization and data.config.graph.canonicalization_use_embedding and cls.graph.embedding_model is None:
+            cls.graph.embedding_model = get_rag_embedding(data.config.embedding.api_type, data.config)  # for name blocking
         cls.doc_chunk = DocChunk(data.config.chunk, cls.ENCODER, data.workspace.make_for("chunk_storage"))
+        if data.config.graph.graph_type == "passage_graph":
+            cls.graph.doc_chunk = cls.doc_chunk  # Passage nodes only reference their chunks
         cls.time_manager = TimeStatistic()
         cls.retriever_context = RetrieverContext()
         data = cls._init_storage_namespace(data)
@@ -240,7 +244,10 @@ class GraphRAG(ContextMixin, BaseModel):
             if not node_metadata:
                 logger.warning("No node metadata found. Skipping entity indexing.")
           
-            await self.entities_vdb.build_index(await self.graph.nodes_data(),node_metadata, False)
+            # The index of an incrementally updated graph misses its new and rewritten nodes, it is rebuilt
+            await self.entities_vdb.build_index(await self.graph.nodes_data(), node_metadata,
+                                                self.graph.updated_incrementally,
+                                                embeddings=await self.graph.node_embeddings())
 
         # Graph Augmentation Stage  (Optional) 
         # For HippoRAG and MedicalRAG, similarities between entities are utilized to create additional edges.
@@ -9,7 +9,11 @@ class BaseIndex(ABC):
         self.config = config
         self._index = None
 
-    async def build_index(self, elements, meta_data, force=False):
+    async def build_index(self, elements, meta_data, force=False, embeddings=None):
+        """
+        Build the index of the elements, `embeddings` are the precomputed embeddings of the elements (in the same
+        order), so that they are not embedded again.
+        """
         logger.info("Starting insert elements of the given graph into vector database")
  
         from_load = False
@@ -23,7 +27,10 @@ class BaseIndex(ABC):
             # Note: When you successfully load the index from a file, you don't need to rebuild it.
             await self.clean_index()
             logger.info("Building index for input elements")
-            await self._update_index(elements, meta_data)
+            if embeddings is not None and len(embeddings) != len(elements):
+                logger.warning("The precomputed embeddings do not match the elements, embedding the elements instead")
+                embeddings = None
+            await self._update_index(elements, meta_data, embeddings)
             self._storage_index()
             logger.info("Index successfully built and stored.")
         logger.info("✅ Finished starting insert entities of the given graph into vector database")
@@ -44,7 +51,7 @@ class BaseIndex(ABC):
         pass
 
     @abstractmethod
-    async def _update_index(self, elements, meta_data):
+    async def _update_index(self, elements, meta_data, embeddings=None):
         pass
 
     @abstractmethod
@@ -70,6 +77,13 @@ class BaseIndex(ABC):
     async def get_max_score(self, query):
         pass
 
+    async def get_embedding_matrix(self, meta_key):
+        """
+        Return the stored embeddings as (keys, matrix), where keys[i] is the `meta_key` metadata of the i-th row.
+        Indexes that cannot expose their embeddings return None.
+        """
+        return None
+
     async def clean_index(self):
        clean_storage(self.config.persist_path)
        
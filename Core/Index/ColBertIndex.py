@@ -29,7 +29,8 @@ class ColBertIndex(BaseIndex):
             kmeans_niters=self.config.kmeans_niters,
         )
 
-    async def _update_index(self, elements, meta_data):
+    async def _update_index(self, elements, meta_data, embeddings=None):
+        # ColBERT indexes the token-level embeddings of its own model, the precomputed embeddings are not used
 
         with Run().context(
                 RunConfig(nranks=self.config.ranks, experiment=self.index_config.experiment,
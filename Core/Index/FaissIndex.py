@@ -54,7 +54,7 @@ class FaissIndex(BaseIndex):
     def _embed_text(self, text: str):
         return self.embedding_model._get_text_embedding(text)
     
-    async def _update_index(self, datas: list[dict[str:Any]], meta_data: list):
+    async def _update_index(self, datas: list[dict[str:Any]], meta_data: list, embeddings=None):
         async def process_document(data):
             document = Document(
                 doc_id=mdhash_id(data["content"]),
@@ -68,7 +68,10 @@ class FaissIndex(BaseIndex):
         texts = [doc.text for doc in documents] 
 
 
-        text_embeddings = self.embedding_model._get_text_embeddings(texts)
+        if embeddings is not None:
+            text_embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        else:
+            text_embeddings = self.embedding_model._get_text_embeddings(texts)
 
   
         vector_store = FaissVectorStore(faiss_index=faiss.IndexHNSWFlat(self.embedding_model.dimensions, 32))
@@ -137,6 +140,18 @@ class FaissIndex(BaseIndex):
         # self.config.embed_model
         # return VectorStoreIndex([])
 
+    async def get_embedding_matrix(self, meta_key):
+        # Read the embeddings computed at index time back, instead of embedding the texts again
+        keys, embeddings = [], []
+        faiss_index = self._index.vector_store.client
+        stored_embeddings = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+        for vector_id, node_id in self._index.index_struct.nodes_dict.items():
+            keys.append(self._index.docstore.get_node(node_id).metadata[meta_key])
+            embeddings.append(stored_embeddings[int(vector_id)])
+        if len(embeddings) == 0:
+            return None
+        return keys, np.asarray(embeddings, dtype=np.float32)
+
     async def _similarity_score(self, object_q, object_d):
         # For llama_index based vector database, we do not need it now!
         pass
@@ -3,7 +3,8 @@ from Core.Common.Logger import logger
 import os
 from typing import Any
 from llama_index.core.schema import (
-    Document
+    Document,
+    TextNode
 )
 from llama_index.core import StorageContext, load_index_from_storage, VectorStoreIndex, Settings
 from Core.Index.BaseIndex import BaseIndex, VectorIndexNodeResult, VectorIndexEdgeResult
@@ -48,7 +49,7 @@ class VectorIndex(BaseIndex):
     async def retrieval_batch(self, queries, top_k):
         pass
 
-    async def _update_index(self, datas: list[dict[str:Any]], meta_data: list):
+    async def _update_index(self, datas: list[dict[str:Any]], meta_data: list, embeddings=None):
         async def process_document(data):
             document = Document(
                 doc_id=mdhash_id(data["content"]),
@@ -59,8 +60,14 @@ class VectorIndex(BaseIndex):
             return document
 
         documents = await asyncio.gather(*[process_document(data) for data in datas])
-        parser = SimpleNodeParser.from_defaults()
-        nodes = parser.get_nodes_from_documents(documents)
+        if embeddings is not None:
+            # One node per element with its precomputed embedding, the embedding model is not called
+            nodes = [TextNode(text=doc.text, embedding=embedding, metadata=doc.metadata,
+                              excluded_embed_metadata_keys=meta_data)
+                     for doc, embedding in zip(documents, np.asarray(embeddings, dtype=np.float32).tolist())]
+        else:
+            parser = SimpleNodeParser.from_defaults()
+            nodes = parser.get_nodes_from_documents(documents)
         self._index = VectorStoreIndex(nodes)
         logger.info("refresh index size is {}".format(len(nodes)))
 
@@ -99,6 +106,17 @@ class VectorIndex(BaseIndex):
         # self.config.embed_model
         return VectorStoreIndex([])
 
+    async def get_embedding_matrix(self, meta_key):
+        # Read the embeddings computed at index time back, instead of embedding the texts again
+        keys, embeddings = [], []
+        vector_store = self._index.vector_store
+        for node_id in self._index.index_struct.nodes_dict.values():
+            keys.append(self._index.docstore.get_node(node_id).metadata[meta_key])
+            embeddings.append(vector_store.get(node_id))
+        if len(embeddings) == 0:
+            return None
+        return keys, np.asarray(embeddings, dtype=np.float32)
+
     async def _similarity_score(self, object_q, object_d):
         # For llama_index based vector database, we do not need it now!
         pass
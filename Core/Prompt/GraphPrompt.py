@@ -213,6 +213,12 @@ Text: {input_text}
 Output:
 """
 
+ENTITY_EXTRACTION_PACKED_INPUT = """The text below consists of {num_chunks} independent chunks, each one starts with a line "{chunk_delimiter}".
+Extract the entities and relationships of every chunk separately, and never relate entities from different chunks.
+Before the records of each chunk, output the record ("chunk"{tuple_delimiter}<chunk_id>){record_delimiter}
+
+{chunks}"""
+
 SUMMARIZE_ENTITY_DESCRIPTIONS = """You are a helpful assistant responsible for generating a comprehensive summary of the data provided below.
     Given one or two entities, and a list of descriptions, all related to the same entity or group of entities.
     Please concatenate all of these into a single, comprehensive description. Make sure to include information collected from all the descriptions.
@@ -227,8 +233,26 @@ SUMMARIZE_ENTITY_DESCRIPTIONS = """You are a helpful assistant responsible for g
     Output:
     """
 
+SUMMARIZE_ENTITY_DESCRIPTIONS_BATCH = """You are a helpful assistant responsible for generating comprehensive summaries of the data provided below.
+    You are given a JSON list of items. Each item has an id, one or two entities, and a list of descriptions, all related to the same entity or group of entities.
+    For each item, please concatenate all of its descriptions into a single, comprehensive description. Make sure to include information collected from all the descriptions of that item, and never mix information across items.
+    If the provided descriptions are contradictory, please resolve the contradictions and provide a single, coherent summary.
+    Make sure it is written in third person, and include the entity names so we the have full context.
+    Respond with a JSON object in the following format, with exactly one summary for each input id:
+    {{"summaries": [{{"id": "<id>", "summary": "<summary>"}}]}}
+
+    #######
+    -Data-
+    {items}
+    #######
+    Output:
+    """
+
 ENTITY_CONTINUE_EXTRACTION = """MANY entities were missed in the last extraction.  Add them below using the same format:"""
 
+ENTITY_CONTINUE_EXTRACTION_PACKED = """
+Before the added records of each chunk, output the record ("chunk"{tuple_delimiter}<chunk_id>){record_delimiter} again, records without a preceding chunk record are discarded."""
+
 ENTITY_IF_LOOP_EXTRACTION = """It appears some entities may have still been missed.  Answer YES | NO if there are still entities that need to be added."""
 
 LOCAL_RAG_RESPONSE = """---Role---
@@ -369,6 +393,68 @@ Paragraph:
 """
 
 
+NER_PACKED = """
+The paragraph above consists of {num_chunks} independent chunks, each one starts with a line "{chunk_delimiter}".
+Extract the named entities of every chunk separately, and respond with a JSON object in the following format:
+{{"chunks": [{{"id": "<chunk_id>", "named_entities": [...]}}]}}
+"""
+
+OPENIE_POST_NER_PACKED = """
+The paragraph above consists of {num_chunks} independent chunks, each one starts with a line "{chunk_delimiter}", and the named entity lists are given per chunk.
+Construct the triples of every chunk separately, never relate entities from different chunks, and respond with a JSON object in the following format:
+{{"chunks": [{{"id": "<chunk_id>", "triples": [...]}}]}}
+"""
+
+
+NER_OPENIE_FUSED = """Your task is to extract named entities from the given paragraph, and then construct an RDF (Resource Description Framework) graph from the paragraph and the extracted entities.
+Respond with a JSON dict that has a named entity list and a list of triples, with each triple representing a relationship in the RDF graph.
+
+Pay attention to the following requirements:
+- Each triple should contain at least one, but preferably two, of the named entities in the list.
+- Clearly resolve pronouns to their specific names to maintain clarity.
+
+# Here is an example for your reference:
+
+[Example]
+
+Paragraph:
+
+Radio City
+Radio City is India's first private FM radio station and was started on 3 July 2001.
+It plays Hindi, English and regional songs.
+Radio City recently forayed into New Media in May 2008 with the launch of a music portal - PlanetRadiocity.com that offers music related news, videos, songs, and other music-related features.
+
+Output:
+
+{{
+"named_entities": ["Radio City", "India", "3 July 2001", "Hindi", "English", "May 2008", "PlanetRadiocity.com"],
+"triples": [
+            ["Radio City", "located in", "India"],
+            ["Radio City", "is", "private FM radio station"],
+            ["Radio City", "started on", "3 July 2001"],
+            ["Radio City", "plays songs in", "Hindi"],
+            ["Radio City", "plays songs in", "English"],
+            ["Radio City", "forayed into", "New Media"],
+            ["Radio City", "launched", "PlanetRadiocity.com"],
+            ["PlanetRadiocity.com", "launched in", "May 2008"],
+            ["PlanetRadiocity.com", "is", "music portal"],
+            ["PlanetRadiocity.com", "offers", "news"],
+            ["PlanetRadiocity.com", "offers", "videos"],
+            ["PlanetRadiocity.com", "offers", "songs"]
+    ]
+}}
+
+Now please respond with the named entity list and the triple list in JSON format.
+
+Paragraph:```\n{user_input}\n```
+"""
+
+NER_OPENIE_FUSED_PACKED = """
+The paragraph above consists of {num_chunks} independent chunks, each one starts with a line "{chunk_delimiter}".
+Extract the named entities and the triples of every chunk separately, never relate entities from different chunks, and respond with a JSON object in the following format:
+{{"chunks": [{{"id": "<chunk_id>", "named_entities": [...], "triples": [...]}}]}}
+"""
+
 KG_AGNET = """ You are tasked with extracting nodes and relationships from given content. Here's the outline of what you needs to do:
 
 Content Extraction:
@@ -13,6 +13,9 @@ class BasicQuery(BaseQuery):
 
         if self.config.tree_search:
             # For RAPTOR
+            if self.config.tree_traversal:
+                return await self._retriever.retrieve_relevant_content(seed=query, type=Retriever.ENTITY,
+                                                                       mode="tree_traversal")
             return await self._retriever.retrieve_relevant_content(seed=query, tree_node=True, type=Retriever.ENTITY,
                                                                    mode="vdb")
 
@@ -13,7 +13,7 @@ class EntityRetriever(BaseRetriever):
 
         config = kwargs.pop("config")
         super().__init__(config)
-        self.mode_list = ["ppr", "vdb", "from_relation", "tf_df", "all", "by_neighbors", "link_entity", "get_all", "from_relation_by_agent"]
+        self.mode_list = ["ppr", "vdb", "from_relation", "tf_df", "all", "by_neighbors", "link_entity", "get_all", "from_relation_by_agent", "tree_traversal"]
         self.type = "entity"
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -60,6 +60,15 @@ class EntityRetriever(BaseRetriever):
         except Exception as e:
             logger.exception(f"Failed to find relevant entities_vdb: {e}")
 
+    @register_retriever_method(type="entity", method_name="tree_traversal")
+    async def _find_relevant_tree_nodes_by_traversal(self, seed):
+        # For RAPTOR: beam search from the root layer down instead of the flat search over all the tree nodes
+        nodes = await self.graph.traverse_tree(seed, beam_width=self.config.tree_beam_width,
+                                               layer_top_k=self.config.tree_layer_top_k)
+        if not len(nodes):
+            return None
+        return [node.text for node in nodes]
+
     @register_retriever_method(type="entity", method_name="tf_df")
     async def _find_relevant_entities_tf_df(self, seed, corpus, top_k, candidates_idx):
         try:
@@ -1,4 +1,7 @@
 from dataclasses import dataclass, asdict
+from typing import Optional
+
+import numpy as np
 
 @dataclass
 class TextChunk:
@@ -12,4 +15,80 @@ class TextChunk:
 
     @property
     def as_dict(self):
-        return asdict(self)
\ No newline at end of file
+        return asdict(self)
+
+
+class MappedTextChunk:
+    """
+    A chunk of the columnar chunk storage, its fields are read from the storage columns on access, the strings are
+    decoded from the memory-mapped text buffer.
+    """
+    def __init__(self, chunks: "MappedChunks", row: int) -> None:
+        self._chunks = chunks
+        self._row = row
+
+    @property
+    def tokens(self) -> int:
+        return int(self._chunks.tokens[self._row])
+
+    @property
+    def chunk_id(self) -> str:
+        return self._chunks.keys[self._row].decode("utf-8")
+
+    @property
+    def content(self) -> str:
+        return self._chunks.get_text(self._row, MappedChunks.CONTENT)
+
+    @property
+    def doc_id(self) -> str:
+        return self._chunks.get_text(self._row, MappedChunks.DOC_ID)
+
+    @property
+    def index(self) -> int:
+        return int(self._chunks.indices[self._row])
+
+    @property
+    def title(self) -> str:
+        return self._chunks.get_text(self._row, MappedChunks.TITLE)
+
+    def materialize(self) -> TextChunk:
+        return TextChunk(tokens=self.tokens, chunk_id=self.chunk_id, content=self.content, doc_id=self.doc_id,
+                         index=self.index, title=self.title)
+
+
+class MappedChunks:
+    """
+    The columns of the persisted chunks, one row per chunk in the order of the chunk indices: the chunk ids as
+    fixed-width bytes (with their sort order for the lookups), the indices and token counts, and the UTF-8 content,
+    doc id and title of every row concatenated in one (memory-mapped) buffer.
+    """
+    CONTENT, DOC_ID, TITLE = 0, 1, 2
+    NUM_TEXT_FIELDS = 3
+
+    def __init__(self, keys, key_order, indices, tokens, text_offsets, text_buffer) -> None:
+        self.keys = keys
+        self.key_order = key_order
+        self.indices = indices
+        self.tokens = tokens
+        self.text_offsets = text_offsets
+        self.text_buffer = text_buffer
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get_text(self, row: int, text_field: int) -> str:
+        segment = row * self.NUM_TEXT_FIELDS + text_field
+        return bytes(self.text_buffer[self.text_offsets[segment]: self.text_offsets[segment + 1]]).decode("utf-8")
+
+    def row_of_key(self, key: str) -> Optional[int]:
+        key = key.encode("utf-8")
+        pos = int(np.searchsorted(self.keys, key, sorter=self.key_order))
+        if pos < len(self.keys) and self.keys[self.key_order[pos]] == key:
+            return int(self.key_order[pos])
+        return None
+
+    def row_of_index(self, index: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.indices, index))
+        if pos < len(self.indices) and self.indices[pos] == index:
+            return pos
+        return None
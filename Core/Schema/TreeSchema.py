@@ -1,5 +1,8 @@
+from collections.abc import Sequence
 from typing import Dict, List, Set, Tuple, Optional
 
+import numpy as np
+
 class TreeNode:
     def __init__(self, text: str, index: int, children: Set[int], embedding) -> None:
         self.text = text
@@ -7,12 +10,89 @@ class TreeNode:
         self.children = children
         self.embedding = embedding
 
+class MappedTreeNode:
+    """
+    A node of a tree loaded from the mapped storage, its text, children and embedding are read from the storage
+    arrays on access.
+    """
+    def __init__(self, tree: "MappedTree", index: int) -> None:
+        self._tree = tree
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self._tree.get_text(self.index)
+
+    @property
+    def children(self) -> Set[int]:
+        return self._tree.get_children(self.index)
+
+    @property
+    def embedding(self):
+        return self._tree.embeddings[self.index]
+
+class MappedTree:
+    """
+    The arrays of a persisted tree: the float32 embedding matrix (memory-mapped), the layer of every node, the
+    children in the CSR layout, and the UTF-8 texts concatenated in one (memory-mapped) buffer.
+    """
+    def __init__(self, embeddings, layers, children_indptr, children_indices, text_offsets, text_buffer) -> None:
+        self.embeddings = embeddings
+        self.layers = layers
+        self.children_indptr = children_indptr
+        self.children_indices = children_indices
+        self.text_offsets = text_offsets
+        self.text_buffer = text_buffer
+
+    def get_text(self, index: int) -> str:
+        return bytes(self.text_buffer[self.text_offsets[index]: self.text_offsets[index + 1]]).decode("utf-8")
+
+    def get_children(self, index: int) -> Set[int]:
+        return set(self.children_indices[self.children_indptr[index]: self.children_indptr[index + 1]].tolist())
+
+class MappedNodeList(Sequence):
+    """
+    The read-only list of the nodes of a mapped tree at the given indices, the nodes are created on access.
+    """
+    def __init__(self, tree: MappedTree, indices: np.ndarray) -> None:
+        self._tree = tree
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return MappedNodeList(self._tree, self._indices[position])
+        return MappedTreeNode(self._tree, int(self._indices[position]))
+
+class MappedLayerList(Sequence):
+    """
+    The read-only list of the layers of a mapped tree, the nodes of a layer are looked up in the layer array on access.
+    """
+    def __init__(self, tree: MappedTree) -> None:
+        self._tree = tree
+        self._num_layers = int(tree.layers.max()) + 1 if len(tree.layers) > 0 else 0
+
+    def __len__(self) -> int:
+        return self._num_layers
+
+    def __getitem__(self, layer):
+        if isinstance(layer, slice):
+            return [self[index] for index in range(self._num_layers)[layer]]
+        if layer < 0:
+            layer += self._num_layers
+        if not 0 <= layer < self._num_layers:
+            raise IndexError("layer index out of range")
+        return MappedNodeList(self._tree, np.flatnonzero(self._tree.layers == layer))
+
 class TreeSchema:
     def __init__(
         self, all_nodes: List[TreeNode]  = None, layer_to_nodes: List[TreeNode] = None
     ) -> None:
         self.all_nodes = all_nodes
         self.layer_to_nodes = layer_to_nodes
+        self.mapped: Optional[MappedTree] = None  # Set when the tree is loaded from the mapped storage
 
     @property
     def num_layers(self) -> int:
@@ -36,4 +116,4 @@ class TreeSchema:
     def root_nodes(self) -> int:
         if (self.num_layers == 0):
             return None
-        return self.layer_to_nodes[-1]
\ No newline at end of file
+        return self.layer_to_nodes[-1]
@@ -30,6 +30,12 @@ class BaseGraphStorage(BaseStorage):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_node_batch(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        raise NotImplementedError
+
+    async def get_edge_batch(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        raise NotImplementedError
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -38,6 +44,12 @@ class BaseGraphStorage(BaseStorage):
     ):
         raise NotImplementedError
 
+    async def upsert_node_batch(self, nodes_data: dict[str, dict]):
+        raise NotImplementedError
+
+    async def upsert_edge_batch(self, edges_data: dict[tuple[str, str], dict]):
+        raise NotImplementedError
+
     async def clustering(self, algorithm: str):
         raise NotImplementedError
 
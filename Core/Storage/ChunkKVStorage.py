@@ -1,46 +1,69 @@
 import pickle
 from dataclasses import dataclass, field
 from typing import Dict,  List, Optional, Union
-from Core.Common.Utils import split_string_by_multi_markers 
+from Core.Common.Utils import split_string_by_multi_markers, write_json, load_json
 from Core.Common.Constants import GRAPH_FIELD_SEP
 import numpy as np
 import os
-import numpy.typing as npt
 from Core.Common.Logger import logger
 from Core.Storage.BaseKVStorage import BaseKVStorage
-from Core.Schema.ChunkSchema import TextChunk
+from Core.Schema.ChunkSchema import TextChunk, MappedTextChunk, MappedChunks
+
+CHUNK_INDEX_FILE = "chunk_index.npz"
+CHUNK_TEXT_FILE = "chunk_text.bin"
+
+
 @dataclass
 class ChunkKVStorage(BaseKVStorage):
-    data_name = "chunk_data_idx.pkl"
+    """
+    The chunks are persisted as columns: the ids, indices and token counts as NumPy arrays, and the strings as
+    offsets into one UTF-8 text buffer. A loaded storage reads the columns in place (the text buffer is
+    memory-mapped) and decodes a chunk only when it is accessed; it is materialized into the in-memory dicts on
+    the first write.
+    """
+    data_name = "chunk_data_idx.pkl"  # Legacy pickled chunks, only read when the columnar chunks do not exist
     chunk_name = "chunk_data_key.pkl"
+    meta_name = "chunk_meta.json"
     _data: Dict[int, TextChunk] = field(init=False, default_factory=dict)
     _chunk: Dict[str, TextChunk] = field(init=False, default_factory=dict)
     _key_to_index: Dict[str, int] = field(init=False, default_factory=dict)
-    _np_keys: Optional[npt.NDArray[np.object_]] = field(init=False, default=None)
+    _mapped: Optional[MappedChunks] = field(init=False, default=None)
+    fingerprint: Optional[str] = field(init=False, default=None)  # Hash of the chunked corpus and chunk parameters
 
     async def size(self) -> int:
+        if self._mapped is not None:
+            return len(self._mapped)
         return len(self._data)
 
-    async def get_by_key(self, key:str) -> TextChunk:
+    async def get_by_key(self, key: str) -> Union[TextChunk, MappedTextChunk]:
+        if self._mapped is not None:
+            row = self._mapped.row_of_key(key)
+            return None if row is None else MappedTextChunk(self._mapped, row)
         return self._data.get(self._key_to_index.get(key, None), None)
 
-    async def get_data_by_index(self, index) -> TextChunk:
+    async def get_data_by_index(self, index) -> Union[TextChunk, MappedTextChunk]:
+        if self._mapped is not None:
+            row = self._mapped.row_of_index(index)
+            return None if row is None else MappedTextChunk(self._mapped, row)
         return self._data.get(index, None)
 
+    async def get_key_by_index(self, index) -> str:
+        chunk = await self.get_data_by_index(index)
+        return None if chunk is None else chunk.chunk_id
 
-        
     async def get_index_by_merge_key(self, merge_chunk_id: str) -> list[int]:
-        key_list  = split_string_by_multi_markers(merge_chunk_id, [GRAPH_FIELD_SEP])
-        index_list = [self._key_to_index.get(chunk_id, None) for chunk_id in key_list]
+        key_list = split_string_by_multi_markers(merge_chunk_id, [GRAPH_FIELD_SEP])
+        index_list = [await self.get_index_by_key(chunk_id) for chunk_id in key_list]
         return index_list
-    
-    async def get_index_by_key(self, key:str) -> int:
-        return self._key_to_index.get(key, None)
-
-
 
+    async def get_index_by_key(self, key: str) -> int:
+        if self._mapped is not None:
+            row = self._mapped.row_of_key(key)
+            return None if row is None else int(self._mapped.indices[row])
+        return self._key_to_index.get(key, None)
 
     async def upsert_batch(self, keys, values) -> None:
+        self.materialize()
         for key, value in zip(keys, values):
             self._chunk[key] = value
             index = self._key_to_index.get(key, None)
@@ -48,8 +71,9 @@ class ChunkKVStorage(BaseKVStorage):
                 index = value.index
                 self._key_to_index[key] = index
                 self._data[index] = value
+
     async def upsert(self, key, value) -> None:
-        
+        self.materialize()
         self._chunk[key] = value
         index = self._key_to_index.get(key, None)
         if index is None:
@@ -59,67 +83,119 @@ class ChunkKVStorage(BaseKVStorage):
         self._data[index] = value
 
     async def delete_by_key(self, key) -> None:
-
+        self.materialize()
         index = self._key_to_index.pop(key, None)
         if index is not None:
             self._data.pop(index, None)
+            self._chunk.pop(key, None)
         else:
             logger.warning(f"Key '{key}' not found in indexed key-value storage.")
 
-    
     async def chunk_datas(self):
-        inserting_chunks = {key: value for key, value in self._chunk.items() if key in self._chunk}
-
-        
-        return list(inserting_chunks.items())
+        return await self.get_chunks()
+
+    def clear(self):
+        self._data = {}
+        self._chunk = {}
+        self._key_to_index = {}
+        self._mapped = None
+        self.fingerprint = None
+
+    def materialize(self):
+        # The mapped columns are read-only, they are decoded into the dicts before a write
+        if self._mapped is None:
+            return
+        chunks = [MappedTextChunk(self._mapped, row).materialize() for row in range(len(self._mapped))]
+        self._mapped = None
+        self._chunk = {chunk.chunk_id: chunk for chunk in chunks}
+        self._data = {chunk.index: chunk for chunk in chunks}
+        self._key_to_index = {chunk.chunk_id: chunk.index for chunk in chunks}
 
     @property
     def dat_idx_pkl_file(self):
-       return self.namespace.get_save_path(self.data_name)
+        return self.namespace.get_save_path(self.data_name)
+
     @property
     def dat_key_pkl_file(self):
         return self.namespace.get_save_path(self.chunk_name)
-    
+
+    @property
+    def meta_file(self):
+        return self.namespace.get_save_path(self.meta_name)
+
+    @property
+    def chunk_index_file(self):
+        return self.namespace.get_save_path(CHUNK_INDEX_FILE)
+
+    @property
+    def chunk_text_file(self):
+        return self.namespace.get_save_path(CHUNK_TEXT_FILE)
+
     async def load_chunk(self):
-        # Attempting to load the graph from the specified pkl file
-        logger.info(f"Attempting to load the chunk data from: {self.dat_idx_pkl_file} and {self.dat_key_pkl_file}" )
-        if os.path.exists(self.dat_idx_pkl_file) and os.path.exists(self.dat_key_pkl_file):
-            try:
+        logger.info(f"Attempting to load the chunk data from: {self.chunk_index_file}")
+        try:
+            if os.path.exists(self.chunk_index_file) and os.path.exists(self.chunk_text_file):
+                self.clear()
+                self._mapped = self.read_chunk_data(self.chunk_index_file, self.chunk_text_file)
+            elif os.path.exists(self.dat_idx_pkl_file) and os.path.exists(self.dat_key_pkl_file):
+                self.clear()
                 with open(self.dat_idx_pkl_file, "rb") as file:
                     self._data = pickle.load(file)
                 with open(self.dat_key_pkl_file, "rb") as file:
                     self._chunk = pickle.load(file)
                 self._key_to_index = {key: value.index for key, value in self._chunk.items()}
-                logger.info(
-                    f"Successfully loaded chunk data (idx and key) from: {self.dat_idx_pkl_file}")
-                return True
-            except Exception as e:
-                logger.error(
-                    f"Failed to load chunk data from: {self.dat_idx_pkl_file} and {self.dat_key_pkl_file} with {e}! Need to re-chunk the documents.")
+            else:
+                logger.info("Chunk data does not exist! Need to chunk the documents from scratch.")
                 return False
-        else:
-            # Pkl file doesn't exist; need to construct the tree from scratch
-            logger.info("Pkl file does not exist! Need to chunk the documents from scratch.")
+            self.fingerprint = (load_json(self.meta_file) or {}).get("fingerprint")
+            logger.info(f"Successfully loaded {await self.size()} chunks")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load chunk data from: {self.chunk_index_file} with {e}! Need to re-chunk the documents.")
+            self.clear()
             return False
+
     async def _persist(self):
-        logger.info(f"Writing data into {self.dat_idx_pkl_file} and {self.dat_key_pkl_file}")
-  
-        self.write_chunk_data(self._data, self.dat_idx_pkl_file)
-        self.write_chunk_data(self._chunk, self.dat_key_pkl_file)
+        if self._mapped is not None:
+            # Nothing was written since the chunks were loaded
+            return
+        logger.info(f"Writing data into {self.chunk_index_file} and {self.chunk_text_file}")
+        self.write_chunk_data([self._data[index] for index in sorted(self._data)], self.chunk_index_file,
+                              self.chunk_text_file)
+        write_json({"fingerprint": self.fingerprint}, self.meta_file)
+
+    @staticmethod
+    def write_chunk_data(chunks: List[TextChunk], index_file: str, text_file: str):
+        """
+        Write the chunks (sorted by their indices) as an index of NumPy columns (.npz) and a text buffer holding
+        the UTF-8 content, doc id and title of every chunk.
+        """
+        keys = np.array([chunk.chunk_id.encode("utf-8") for chunk in chunks], dtype=np.bytes_)
+        texts = [str(text if text is not None else "").encode("utf-8") for chunk in chunks
+                 for text in (chunk.content, chunk.doc_id, chunk.title)]
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        text_offsets[1:] = np.cumsum([len(text) for text in texts])
+
+        with open(text_file, "wb") as file:
+            file.write(b"".join(texts))
+        # The index is written last, it marks the chunks as complete
+        np.savez(index_file, keys=keys, key_order=np.argsort(keys, kind="stable"),
+                 indices=np.array([chunk.index for chunk in chunks], dtype=np.int64),
+                 tokens=np.array([chunk.tokens for chunk in chunks], dtype=np.int64), text_offsets=text_offsets)
+
     @staticmethod
-    def write_chunk_data(data, pkl_file):
-        with open(pkl_file, "wb") as file:
-            pickle.dump(data, file)
+    def read_chunk_data(index_file: str, text_file: str) -> MappedChunks:
+        index = np.load(index_file)
+        # An empty file can not be memory-mapped
+        text_buffer = np.memmap(text_file, dtype=np.uint8, mode="r") if os.path.getsize(text_file) > 0 else b""
+        return MappedChunks(keys=index["keys"], key_order=index["key_order"], indices=index["indices"],
+                            tokens=index["tokens"], text_offsets=index["text_offsets"], text_buffer=text_buffer)
 
     async def persist(self):
-        # Attempting to save the graph to the specified pkl file
         await self._persist()
 
     async def get_chunks(self):
+        if self._mapped is not None:
+            return [(chunk.chunk_id, chunk) for chunk in
+                    (MappedTextChunk(self._mapped, row) for row in range(len(self._mapped)))]
         return list(self._chunk.items())
-    
-    async def size(self):
-        print(len(self._data))
-        print(len(self._chunk))
-        assert len(self._data) == len(self._chunk)
-        return len(self._data)
\ No newline at end of file
@@ -152,6 +152,21 @@ class NetworkXStorage(BaseGraphStorage):
     ):
         self._graph.add_edge(source_node_id, target_node_id, **edge_data)
 
+    async def get_node_batch(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        return [self._graph.nodes.get(node_id) for node_id in node_ids]
+
+    async def get_edge_batch(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return [self._graph.edges.get(edge) for edge in edges]
+
+    async def upsert_node_batch(self, nodes_data: dict[str, dict]):
+        self._graph.add_nodes_from(nodes_data.items())
+
+    async def upsert_edge_batch(self, edges_data: dict[tuple[str, str], dict]):
+        self._graph.add_edges_from(
+            (source_node_id, target_node_id, edge_data)
+            for (source_node_id, target_node_id), edge_data in edges_data.items()
+        )
+
     async def _cluster_data_to_subgraphs(self, cluster_data: dict[str, list[dict[str, str]]]):
 
         for node_id, clusters in cluster_data.items():
@@ -1,5 +1,5 @@
 from Core.Storage.BaseGraphStorage import BaseGraphStorage
-from Core.Schema.TreeSchema import TreeNode, TreeSchema
+from Core.Schema.TreeSchema import TreeNode, TreeSchema, MappedTree, MappedNodeList, MappedLayerList
 from Core.Common.Logger import logger
 
 from typing import Dict, Any
@@ -7,68 +7,160 @@ from typing import Dict, Any
 import os
 import pickle
 
+import numpy as np
+
+TREE_EMBEDDING_FILE = "tree_embeddings.npy"
+TREE_INDEX_FILE = "tree_index.npz"
+TREE_TEXT_FILE = "tree_text.bin"
+LEAVES_PREFIX = "leaves_"
+
 
 class TreeGraphStorage(BaseGraphStorage):
     def __init__(self):
         super().__init__()
 
-    name: str = "tree_data.pkl"
+    name: str = "tree_data.pkl"  # Legacy pickled tree, only read when the mapped tree does not exist
     _tree: TreeSchema = TreeSchema()
 
     def clear(self):
         self._tree = TreeSchema()
 
     async def _persist(self, force):
-        if (os.path.exists(self.tree_pkl_file) and not force):
+        if (os.path.exists(self._mapped_file(TREE_INDEX_FILE)) and not force):
             return
-        logger.info(f"Writing graph into {self.tree_pkl_file}")
-        TreeGraphStorage.write_tree_graph(self.tree, self.tree_pkl_file)
+        logger.info(f"Writing graph into {self._mapped_file(TREE_INDEX_FILE)}")
+        self.write_tree_graph(self.tree, prefix="")
+
+    def write_tree_graph(self, tree: TreeSchema, prefix: str):
+        """
+        Write the tree as a float32 embedding matrix (.npy), an index of the layers, children and text offsets
+        (.npz), and a text buffer holding all the UTF-8 texts.
+        """
+        nodes = tree.all_nodes or []
+        if tree.mapped is not None:
+            layers = np.asarray(tree.mapped.layers, dtype=np.int32)
+        else:
+            layers = np.zeros(len(nodes), dtype=np.int32)
+            for layer, layer_nodes in enumerate(tree.layer_to_nodes or []):
+                for node in layer_nodes:
+                    layers[node.index] = layer
+
+        children = [sorted(node.children) if node.children else [] for node in nodes]
+        children_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        children_indptr[1:] = np.cumsum([len(node_children) for node_children in children])
+        children_indices = np.array([child for node_children in children for child in node_children], dtype=np.int64)
+
+        texts = [node.text.encode("utf-8") for node in nodes]
+        text_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        text_offsets[1:] = np.cumsum([len(text) for text in texts])
+
+        embeddings = np.asarray([node.embedding for node in nodes], dtype=np.float32)
+        self._replace_file(self._mapped_file(TREE_EMBEDDING_FILE, prefix), lambda file: np.save(file, embeddings))
+        self._replace_file(self._mapped_file(TREE_TEXT_FILE, prefix), lambda file: file.write(b"".join(texts)))
+        # The index is written last, it marks the tree as complete
+        self._replace_file(self._mapped_file(TREE_INDEX_FILE, prefix), lambda file: np.savez(
+            file, layers=layers, children_indptr=children_indptr, children_indices=children_indices,
+            text_offsets=text_offsets))
 
-    def write_tree_graph(tree, tree_pkl_file):
-        with open(tree_pkl_file, "wb") as file:
-            pickle.dump(tree, file)
+    @staticmethod
+    def _replace_file(path: str, write):
+        # The files of a loaded tree may be memory-mapped, so they are replaced instead of being overwritten in place:
+        # the mappings keep reading the previous files
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            write(file)
+        os.replace(temp_path, path)
+
+    def read_tree_graph(self, prefix: str) -> TreeSchema:
+        index = np.load(self._mapped_file(TREE_INDEX_FILE, prefix))
+        embeddings = np.load(self._mapped_file(TREE_EMBEDDING_FILE, prefix), mmap_mode="r")
+        text_file = self._mapped_file(TREE_TEXT_FILE, prefix)
+        # An empty file can not be memory-mapped
+        text_buffer = np.memmap(text_file, dtype=np.uint8, mode="r") if os.path.getsize(text_file) > 0 else b""
+        mapped = MappedTree(embeddings=embeddings, layers=index["layers"], children_indptr=index["children_indptr"],
+                            children_indices=index["children_indices"], text_offsets=index["text_offsets"],
+                            text_buffer=text_buffer)
+
+        # The nodes and the layers are served from the mapped arrays, a node is only created when it is accessed
+        tree = TreeSchema(all_nodes=MappedNodeList(mapped, np.arange(len(mapped.layers))),
+                          layer_to_nodes=MappedLayerList(mapped))
+        tree.mapped = mapped
+        return tree
 
     async def load_tree_graph(self, force) -> bool:
+        if os.path.exists(self._mapped_file(TREE_INDEX_FILE)):
+            return self._load_from(lambda: self.read_tree_graph(prefix=""), self._mapped_file(TREE_INDEX_FILE))
         # Attempting to load the graph from the specified pkl file
         logger.info(f"Attempting to load the tree from: {self.tree_pkl_file}")
         if os.path.exists(self.tree_pkl_file):
-            try:
-                with open(self.tree_pkl_file, "rb") as file:
-                    self._tree = pickle.load(file)
-                logger.info(
-                    f"Successfully loaded tree from: {self.tree_pkl_file} with {len(self._tree.all_nodes)} nodes and {self._tree.num_layers} layers")
-                return True
-            except Exception as e:
-                logger.error(
-                    f"Failed to load tree from: {self.tree_pkl_file} with {e}! Need to re-build the tree.")
-                return False
+            return self._load_from(lambda: self._read_pickled_tree(self.tree_pkl_file), self.tree_pkl_file)
         else:
             # Pkl file doesn't exist; need to construct the tree from scratch
             logger.info("Pkl file does not exist! Need to build the tree from scratch.")
             return False
 
-    async def write_tree_leaves(self):
-        TreeGraphStorage.write_tree_graph(tree=self.tree, tree_pkl_file=self.tree_leaves_pkl_file)
-    
+    async def write_tree_leaves(self, tree: TreeSchema = None):
+        self.write_tree_graph(tree=tree or self.tree, prefix=LEAVES_PREFIX)
+
     async def load_tree_graph_from_leaves(self, force = False) -> bool:
+        if os.path.exists(self._mapped_file(TREE_INDEX_FILE, LEAVES_PREFIX)):
+            return self._load_from(lambda: self._materialize(self.read_tree_graph(prefix=LEAVES_PREFIX)),
+                                   self._mapped_file(TREE_INDEX_FILE, LEAVES_PREFIX))
         # Attempting to load the graph from the specified pkl file
         logger.info(f"Attempting to load the tree leaves from: {self.tree_leaves_pkl_file}")
         if os.path.exists(self.tree_leaves_pkl_file):
-            try:
-                with open(self.tree_leaves_pkl_file, "rb") as file:
-                    self._tree = pickle.load(file)
-                logger.info(
-                    f"Successfully loaded tree from: {self.tree_leaves_pkl_file} with {len(self._tree.leaf_nodes)} leaves")
-                return True
-            except Exception as e:
-                logger.error(
-                    f"Failed to load tree from: {self.tree_leaves_pkl_file} with {e}! Need to re-build the tree.")
-                return False
+            return self._load_from(lambda: self._read_pickled_tree(self.tree_leaves_pkl_file),
+                                   self.tree_leaves_pkl_file)
         else:
             # Pkl file doesn't exist; need to construct the tree from scratch
             logger.info("Pkl file does not exist! Need to build the tree from scratch.")
             return False
 
+    def _load_from(self, read, path) -> bool:
+        try:
+            self._tree = read()
+            logger.info(
+                f"Successfully loaded tree from: {path} with {self._tree.num_nodes} nodes and {self._tree.num_layers} layers")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load tree from: {path} with {e}! Need to re-build the tree.")
+            return False
+
+    @staticmethod
+    def _read_pickled_tree(tree_pkl_file) -> TreeSchema:
+        with open(tree_pkl_file, "rb") as file:
+            tree = pickle.load(file)
+        tree.mapped = None
+        return tree
+
+    @staticmethod
+    def _materialize(tree: TreeSchema) -> TreeSchema:
+        # Upper layers are built on top of the leaves, so the loaded leaves are turned back into in-memory nodes
+        all_nodes = [TreeNode(text=node.text, index=node.index, children=node.children,
+                              embedding=np.array(node.embedding)) for node in tree.all_nodes]
+        return TreeSchema(all_nodes=all_nodes,
+                          layer_to_nodes=[[all_nodes[node.index] for node in layer] for layer in tree.layer_to_nodes])
+
+    def materialize(self):
+        """
+        Turn a tree loaded from the mapped storage into in-memory nodes, so that it can be modified.
+        """
+        if self.tree.mapped is not None:
+            self._tree = self._materialize(self.tree)
+
+    def _mapped_file(self, file_name: str, prefix: str = "") -> str:
+        assert self.namespace is not None
+        return self.namespace.get_save_path(prefix + file_name)
+
+    @property
+    def embedding_matrix(self) -> np.ndarray:
+        """
+        The float32 (num_nodes, dim) embedding matrix in the node index order, memory-mapped for a loaded tree.
+        """
+        if self.tree.mapped is not None:
+            return self.tree.mapped.embeddings
+        return np.asarray([node.embedding for node in self.tree.all_nodes or []], dtype=np.float32)
+
     @property
     def tree(self):
         return self._tree
@@ -117,8 +209,46 @@ class TreeGraphStorage(BaseGraphStorage):
         layer = node_data['layer']
         self._tree.layer_to_nodes[layer].append(node)
         self._tree.all_nodes.append(node)
+        # The mapped arrays no longer cover all the nodes
+        self._tree.mapped = None
         return
 
+    def get_embeddings(self, indices: np.ndarray) -> np.ndarray:
+        # Only the requested rows are read from the mapped matrix
+        if self.tree.mapped is not None:
+            return np.asarray(self.tree.mapped.embeddings[indices], dtype=np.float32)
+        return np.asarray([self.nodes[index].embedding for index in indices], dtype=np.float32).reshape(len(indices), -1)
+
+    def get_children_indices(self, indices: np.ndarray) -> np.ndarray:
+        mapped = self.tree.mapped
+        if mapped is not None:
+            children = [mapped.children_indices[mapped.children_indptr[index]: mapped.children_indptr[index + 1]]
+                        for index in indices]
+        else:
+            children = [np.fromiter(self.nodes[index].children or [], dtype=np.int64) for index in indices]
+        # A node may be the child of several nodes under soft clustering
+        return np.unique(np.concatenate(children)) if len(children) > 0 else np.array([], dtype=np.int64)
+
+    def traverse(self, query_embedding, beam_width: int, layer_top_k: int) -> list:
+        """
+        Beam-search the tree top-down: score the candidates of a layer by the cosine similarity to the query, select
+        the `layer_top_k` best of them, and expand the children of the `beam_width` best ones into the next layer.
+        """
+        if self.num_layers == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        selected = []
+        candidates = np.array([node.index for node in self.root_nodes], dtype=np.int64)
+        while len(candidates) > 0:
+            embeddings = self.get_embeddings(candidates)
+            scores = embeddings @ query / np.maximum(np.linalg.norm(embeddings, axis=1), 1e-12)
+            ranked = candidates[np.argsort(-scores, kind="stable")]
+            selected.extend(ranked[:layer_top_k].tolist())
+            candidates = self.get_children_indices(ranked[:beam_width])
+        return [self.nodes[index] for index in selected]
+
     async def load_graph(self, force: bool = False) -> bool:
         return await self.load_tree_graph(force)
 
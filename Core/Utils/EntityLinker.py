@@ -0,0 +1,196 @@
+"""
+Entity linking backends of the PassageGraph.
+
+Every linker annotates a text with the raw WAT annotation format, i.e., a list of dicts with the keys
+start, end, rho, explanation, spot, id and title, so the backends are interchangeable:
+
+- WATEntityLinker: the WAT web service, with a shared connection pool, bounded concurrency and retries.
+- DictionaryEntityLinker: a local alias-table linker, which needs no network and makes the builds reproducible.
+
+Any linker can be wrapped by CachedEntityLinker, which caches the annotations on disk by the hash of the text.
+"""
+import asyncio
+import json
+import re
+from abc import ABC, abstractmethod
+
+import aiohttp
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from Core.Common.Constants import GCUBE_TOKEN
+from Core.Common.Logger import logger
+from Core.Common.Utils import mdhash_id
+from Core.Storage.JsonKVStorage import JsonKVStorage
+
+WAT_URL = "https://wat.d4science.org/wat/tag/tag"
+WAT_METHOD = "spotter:includeUserHint=true:includeNamedEntity=true:includeNounPhrase=true,prior:k=50,filter-valid,centroid:rescore=true,topk:k=5,voting:relatedness=lm,ranker:model=0046.model,confidence:model=pruner-wiki.linear"
+
+
+def _is_retryable(exception: BaseException) -> bool:
+    # Connection errors, timeouts, rate limits and server errors are transient, the other HTTP errors (e.g., an
+    # invalid token) fail the same way on every attempt
+    if isinstance(exception, aiohttp.ClientResponseError):
+        return exception.status == 429 or exception.status >= 500
+    return isinstance(exception, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class BaseEntityLinker(ABC):
+    name: str = "base"
+
+    @abstractmethod
+    async def annotate(self, text: str) -> list[dict]:
+        """
+        Annotate the text, return the annotations in the raw WAT format, or None if the linking failed.
+        """
+        pass
+
+    async def close(self):
+        pass
+
+
+class WATEntityLinker(BaseEntityLinker):
+    name = "wat"
+
+    def __init__(self, config):
+        self.config = config
+        self._session = None
+        self._semaphore = asyncio.Semaphore(config.entity_linker_max_concurrency)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session is created lazily, since it must be bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.config.entity_linker_max_concurrency)
+            timeout = aiohttp.ClientTimeout(total=self.config.entity_linker_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def annotate(self, text: str) -> list[dict]:
+        payload = [("gcube-token", GCUBE_TOKEN),
+                   ("text", text),
+                   ("lang", 'en'),
+                   ("tokenizer", "nlp4j"),
+                   ('debug', 9),
+                   ("method", WAT_METHOD)]
+        try:
+            async with self._semaphore:
+                async for attempt in AsyncRetrying(
+                        stop=stop_after_attempt(self.config.entity_linker_max_retries),
+                        wait=wait_random_exponential(min=1, max=30),
+                        retry=retry_if_exception(_is_retryable),
+                        reraise=True):
+                    with attempt:
+                        async with self._get_session().get(WAT_URL, params=payload) as response:
+                            response.raise_for_status()
+                            return (await response.json(content_type=None))['annotations']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"All retry attempts of WAT entity linking failed: {e}")
+        return None
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DictionaryEntityLinker(BaseEntityLinker):
+    """
+    Link the longest alias matches of a local alias table to their titles.
+
+    The alias table is a JSON file that maps every title to the list of its aliases, the title itself is always
+    an alias.
+    """
+    name = "dictionary"
+
+    def __init__(self, config):
+        self.config = config
+        if not config.entity_linker_alias_path:
+            raise ValueError("The dictionary entity linker needs an alias table, set entity_linker_alias_path")
+        with open(config.entity_linker_alias_path, encoding="utf-8") as f:
+            alias_table = json.load(f)
+
+        self._aliases = {}
+        for title, aliases in alias_table.items():
+            for alias in [title] + list(aliases):
+                if self._normalize(alias):
+                    self._aliases.setdefault(self._normalize(alias), title)
+        self._max_alias_tokens = max((len(alias.split()) for alias in self._aliases), default=0)
+        self._title_ids = {title: idx for idx, title in enumerate(sorted(alias_table))}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # Tokenized the same way as the annotated texts, e.g., "U.S." becomes "u s"
+        return " ".join(re.findall(r"\w+", text.lower()))
+
+    async def annotate(self, text: str) -> list[dict]:
+        tokens = [(match.start(), match.end(), match.group().lower()) for match in re.finditer(r"\w+", text)]
+        annotations = []
+        start = 0
+        while start < len(tokens):
+            # Greedy longest match starting from the current token
+            for end in range(min(len(tokens), start + self._max_alias_tokens), start, -1):
+                title = self._aliases.get(" ".join(token for _, _, token in tokens[start:end]))
+                if title is not None:
+                    char_start, char_end = tokens[start][0], tokens[end - 1][1]
+                    annotations.append(dict(start=char_start, end=char_end, rho=1.0,
+                                            explanation={"prior_explanation": {"entity_mention_probability": 1.0}},
+                                            spot=text[char_start:char_end], id=self._title_ids[title], title=title))
+                    start = end
+                    break
+            else:
+                start += 1
+        return annotations
+
+
+class CachedEntityLinker(BaseEntityLinker):
+    """
+    Cache the annotations of a linker on disk, keyed by the backend and the hash of the text.
+    """
+
+    def __init__(self, linker: BaseEntityLinker, namespace):
+        self.linker = linker
+        self.name = linker.name
+        self._cache = JsonKVStorage(namespace, "entity_linking_cache")
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def annotate(self, text: str) -> list[dict]:
+        if not self._loaded:
+            # The concurrent annotations wait for a single load of the cache
+            async with self._load_lock:
+                if not self._loaded:
+                    await self._cache.load()
+                    self._loaded = True
+        key = mdhash_id(text, prefix=f"{self.linker.name}-")
+        cached = await self._cache.get_by_id(key)
+        if cached is not None:
+            return cached["annotations"]
+        annotations = await self.linker.annotate(text)
+        if annotations is not None:
+            # Failed linkings are not cached, so they are retried by the next build
+            await self._cache.upsert({key: {"annotations": annotations}})
+        return annotations
+
+    async def persist(self):
+        if self._loaded:
+            await self._cache.persist()
+
+    async def close(self):
+        await self.persist()
+        await self.linker.close()
+
+
+class EntityLinkerFactory:
+    def __init__(self):
+        self.creators = {
+            "wat": WATEntityLinker,
+            "dictionary": DictionaryEntityLinker,
+        }
+
+    def get_entity_linker(self, config, namespace=None) -> BaseEntityLinker:
+        linker = self.creators[config.entity_linker](config)
+        if config.enable_entity_linker_cache and namespace is not None:
+            linker = CachedEntityLinker(linker, namespace)
+        return linker
+
+
+get_entity_linker = EntityLinkerFactory().get_entity_linker
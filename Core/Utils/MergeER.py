@@ -9,7 +9,8 @@ class MergeEntity:
 
     @staticmethod
     def merge_source_ids(existing_source_ids: List[str], new_source_ids):
-        merged_source_ids = list(set(new_source_ids) | set(existing_source_ids))
+        # Keep the first-seen order so that the merged value does not depend on the hash seed
+        merged_source_ids = list(dict.fromkeys(existing_source_ids + new_source_ids))
 
         return GRAPH_FIELD_SEP.join(merged_source_ids)
 
@@ -68,13 +69,13 @@ class MergeRelationship:
     @staticmethod
     def merge_source_ids(existing_source_ids: List[str], new_source_ids):
         return GRAPH_FIELD_SEP.join(
-            set(new_source_ids + existing_source_ids)
+            dict.fromkeys(existing_source_ids + new_source_ids)
         )
 
     @staticmethod
     def merge_keywords(keywords: List[str], new_keywords):
         return GRAPH_FIELD_SEP.join(
-            set(keywords + new_keywords)
+            dict.fromkeys(keywords + new_keywords)
         )
 
     @staticmethod